@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Runs the throughput benchmarks of :mod:`suite` and stores the results as JSON.
+
+Usage from the repository root::
+
+    $ python benchmarks/run.py -o results.json
+    $ python benchmarks/run.py -k plot --compare results.json
+
+Every benchmark is timed like :mod:`timeit`: the number of calls is chosen so
+one measurement takes at least 0.2 s, the best of `repeat` measurements is
+reported as time per call and as items per second. With `--compare` the
+results are compared to an earlier run, benchmarks that got slower by more
+than the threshold are reported and make the run fail.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description="pywisp throughput benchmarks")
+    parser.add_argument('-o', '--output', help="write the results to this JSON file")
+    parser.add_argument('-k', '--filter', default='', help="only run benchmarks containing this string")
+    parser.add_argument('-r', '--repeat', type=int, default=5, help="measurements per benchmark")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare with")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="relative slow down reported as regression (default: 0.1)")
+    args = parser.parse_args(argv)
+    # pywisp changes the working directory on import
+    for name in ['output', 'compare']:
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+    return args
+
+
+def measure(func, repeat):
+    """
+    Times a benchmark callable
+    :return: best and median time per call in seconds
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    times = sorted(t / number for t in timer.repeat(repeat, number))
+    return times[0], times[len(times) // 2]
+
+
+def environment():
+    from pywisp import __version__
+    from pywisp.min import codecBackend
+    try:
+        commit = subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=HERE,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'version': __version__,
+        'commit': commit,
+        'codec': codecBackend,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'system': platform.system(),
+        'cpus': os.cpu_count(),
+        'date': time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def compare(results, old, threshold):
+    """
+    Prints the change of every benchmark found in both runs
+    :return: names of the regressed benchmarks
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in old:
+            continue
+        ratio = result['seconds'] / old[name]['seconds']
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"{name:45s} {ratio:6.2f}x time{flag}")
+    return regressions
+
+
+def main(argv=None):
+    args = parseArgs(argv)
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    sys.path.insert(0, HERE)
+    from suite import BENCHMARKS, app
+
+    results = {}
+    for name, setup, items, unit in BENCHMARKS:
+        if args.filter not in name:
+            continue
+        func = setup()
+        best, median = measure(func, args.repeat)
+        results[name] = {
+            'seconds': best,
+            'median': median,
+            'items': items,
+            'unit': unit,
+            'rate': items / best,
+        }
+        print(f"{name:45s} {best * 1e3:10.3f} ms {items / best:14.0f} {unit}/s", flush=True)
+        app.processEvents()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)['results']
+        if compare(results, old, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks along the path of the data: from the wire through the codec, the
+frame dispatch and the buffers into the plots and the export. Most measure
+throughput, the latency ones the time a single frame takes from the socket
+to the gui thread.
+
+Each benchmark is a setup function returning the callable to time, registered
+with the number of items one call handles.
+"""
+
+import atexit
+import os
+import shutil
+import socket
+import struct
+import sys
+import tempfile
+from collections import OrderedDict
+from itertools import product
+
+import numpy as np
+from PyQt5.QtCore import QEventLoop
+from PyQt5.QtWidgets import QApplication
+
+app = QApplication.instance() or QApplication(sys.argv)
+
+from pywisp.connection import TcpConnection, UdpConnection
+from pywisp.experimentModules import ExperimentModule
+from pywisp.experiments import ExperimentInteractor
+from pywisp.min import Decoder, Frame, packFrame, packFrames
+from pywisp.utils import DataPointBuffer, Exporter, SampleTable, coroutine, pipe
+from pywisp.widgets.plotchart import PlotChart
+
+BENCHMARKS = []
+
+
+def benchmark(items, unit, name=None):
+    """
+    registers a benchmark setup
+    :param items: number of items handled by one call of the timed callable
+    :param unit: name of the items
+    :param name: name of the benchmark, the name of the setup by default
+    """
+    def register(setup):
+        BENCHMARKS.append((name or setup.__name__, setup, items, unit))
+        return setup
+    return register
+
+
+@coroutine
+def Discard():
+    while True:
+        yield
+
+
+def chunks(data, size=2048):
+    """ split data like the reader thread receives it """
+    mv = memoryview(data)
+    return [mv[i:i + size] for i in range(0, len(mv), size)]
+
+
+FRAMES = 10000
+# time and four channels, like the examples' test rigs
+PAYLOAD = struct.pack('<L4d', 1, 0.1, 0.2, 0.3, 0.4)
+
+
+@benchmark(FRAMES, 'frames')
+def min_pack():
+    frames = [(15, PAYLOAD)] * FRAMES
+    return lambda: packFrames(frames)
+
+
+@benchmark(FRAMES, 'frames')
+def min_pack_single():
+    return lambda: [packFrame(15, PAYLOAD) for _ in range(FRAMES)]
+
+
+@benchmark(FRAMES, 'frames')
+def min_unpack():
+    data = chunks(packFrames([(15, PAYLOAD)] * FRAMES))
+    rx = pipe([Decoder, Discard])
+
+    def run():
+        for chunk in data:
+            rx.send(chunk)
+    return run
+
+
+@benchmark(FRAMES, 'frames')
+def tcp_receive():
+    # records of the default 80 byte payload through the complete rx pipe
+    conn = TcpConnection('127.0.0.1', 0)
+    conn.batchSize = 100
+    data = chunks(b''.join(bytes([15]) + PAYLOAD + bytes(80 - len(PAYLOAD))
+                           for _ in range(FRAMES)))
+    rx = conn.worker.rx
+
+    def run():
+        for chunk in data:
+            rx.send(chunk)
+        conn.flush()
+    return run
+
+
+def latency(batchSize):
+    def setup():
+        rig = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        rig.bind(('127.0.0.1', 0))
+        conn = UdpConnection('127.0.0.1', rig.getsockname()[1])
+        conn.batchSize = batchSize
+        received = []
+        conn.received.connect(received.append)
+        conn.receivedBatch.connect(received.extend)
+        conn.connect()
+        atexit.register(rig.close)
+        atexit.register(conn.disconnect)
+        host = conn.sock.getsockname()
+        frame = packFrame(15, PAYLOAD)
+
+        def run():
+            # from the frame arriving at the reader to its delivery in the gui thread
+            del received[:]
+            rig.sendto(frame, host)
+            while not received:
+                app.processEvents(QEventLoop.WaitForMoreEvents)
+        return run
+    return setup
+
+
+benchmark(1, 'frames', "udp_latency")(latency(0))
+benchmark(1, 'frames', "udp_latency_batched")(latency(100))
+
+
+class Rig(ExperimentModule):
+    dataPoints = ['pos', 'phi1', 'phi2', 'u']
+    publicSettings = OrderedDict()
+    frameIds = [15]
+    connection = 'Rig'
+
+    def handleFrame(self, frame):
+        data = struct.unpack('<L4d', frame.payload)
+        return {'Time': data[0], 'DataPoints': dict(zip(Rig.dataPoints, data[1:]))}
+
+
+class Other(Rig):
+    frameIds = [16, 17, 18]
+
+
+@benchmark(FRAMES, 'frames')
+def frame_dispatch():
+    exp = ExperimentInteractor(None)
+    exp._buildFrameDispatch([Other, Rig])
+    frames = [Frame(15, PAYLOAD)] * FRAMES
+
+    def run():
+        for frame in frames:
+            exp.handleFrame(frame, 'Rig')
+    return run
+
+
+VALUES = 100000
+
+
+@benchmark(VALUES, 'values')
+def buffer_add_value():
+    def run():
+        buf = DataPointBuffer()
+        for t in range(VALUES):
+            buf.addValue(t, 0.5)
+    return run
+
+
+@benchmark(VALUES, 'rows')
+def table_add_row():
+    values = (0.1, 0.2, 0.3, 0.4)
+
+    def run():
+        table = SampleTable(Rig.dataPoints)
+        for t in range(VALUES):
+            table.addRow(t, values)
+    return run
+
+
+@benchmark(VALUES, 'values')
+def buffer_extend():
+    time = np.arange(100, dtype=float)
+    values = np.ones(100)
+
+    def run():
+        buf = DataPointBuffer()
+        for _ in range(VALUES // 100):
+            buf.extend(time, values)
+    return run
+
+
+CURVES = 10
+SAMPLES = 100000
+
+
+def plotUpdate(method, window):
+    def setup():
+        chart = PlotChart("benchmark", {
+            "MovingWindowEnable": bool(window),
+            "MovingWindowWidth": window,
+            "downsamplingMethod": method,
+        })
+        t = np.arange(SAMPLES) / 100
+        dataPoints = {}
+        for i in range(CURVES):
+            buf = DataPointBuffer()
+            buf.extend(t, np.sin(t * (i + 1) / 10))
+            dataPoints[str(i)] = buf
+            chart.addCurve(str(i), buf)
+        chart.show()
+        app.processEvents()
+        count = [SAMPLES]
+
+        def run():
+            # new samples arrive between the updates, like during an experiment
+            for buf in dataPoints.values():
+                buf.addValue(count[0] / 100, 0)
+            count[0] += 1
+            chart.updateCurves(dataPoints)
+            app.processEvents()
+        return run
+    return setup
+
+
+for method, window in product(['peak', 'mean', 'subsample', 'off'], [0, 10, 100]):
+    benchmark(CURVES, 'curves', f"plot_update[{method}-window{window}]")(plotUpdate(method, window))
+
+
+ROWS = 50000
+COLUMNS = 20
+
+
+@benchmark(ROWS * COLUMNS, 'values')
+def export_csv():
+    table = SampleTable([str(i) for i in range(COLUMNS)], capacity=ROWS)
+    values = np.random.rand(ROWS, COLUMNS)
+    for t in range(ROWS):
+        table.addRow(t / 1000, values[t])
+    dataPoints = {}
+    for name in table.names:
+        buf = DataPointBuffer()
+        buf.bind(table, name)
+        dataPoints[name] = buf
+    path = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, path, True)
+    fileName = os.path.join(path, 'export.csv')
+
+    def run():
+        exporter = Exporter(dataPoints=dataPoints, fileName=fileName)
+        exporter.runExport()
+        exporter.wait()
+    return run
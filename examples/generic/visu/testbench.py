@@ -19,6 +19,8 @@ class DoublePendulum(ExperimentModule):
         ("Config", 0),
     ])
 
+    frameIds = [15]
+
     connection = Connection.__name__
 
     def getParams(self, data):
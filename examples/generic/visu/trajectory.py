@@ -18,6 +18,8 @@ class Trajectory(ExperimentModule):
         ("values", [0])
     ])
 
+    frameIds = [25]
+
     connection = Connection.__name__
 
     def __init__(self):
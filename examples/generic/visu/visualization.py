@@ -71,7 +71,7 @@ class MplDoublePendulumVisualizer(MplVisualizer):
     def update(self, dataPoints):
         x = phi1 = phi2 = 0
         for name, buffer in dataPoints.items():
-            if buffer.values:
+            if len(buffer):
                 if name == 'pos':
                     x = buffer.values[-1]
                 elif name == 'phi1':
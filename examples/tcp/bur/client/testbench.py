@@ -22,6 +22,7 @@ class Test(ExperimentModule):
                                   ("Value4", 10)])
 
     ids = [10, 12]
+    frameIds = ids[:1]
 
     connection = ConnTestTCP.__name__
 
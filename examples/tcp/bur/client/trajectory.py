@@ -18,6 +18,7 @@ class RampTrajectory(ExperimentModule):
                                   ("EndTime", 15)])
 
     ids = [11, 13]
+    frameIds = ids[:1]
 
     connection = ConnTestTCP.__name__
 
@@ -63,6 +64,7 @@ class SeriesTrajectory(ExperimentModule):
                                   ("EndTime", 15)])
 
     ids = [15, 14]
+    frameIds = ids[:1]
 
     connection = ConnTestTCP.__name__
 
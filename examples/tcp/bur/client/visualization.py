@@ -82,7 +82,7 @@ class MplExampleVisualizer(MplVisualizer):
                }
 
         for key, value in dps.items():
-            if dataPoints[key].values:
+            if len(dataPoints[key]):
                 formatStr = "%." + value[1] + "f"
                 value[0].set_text(formatStr % dataPoints[key].values[-1])
 
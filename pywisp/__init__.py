@@ -15,6 +15,7 @@ from .experiments import *
 from .experiments import *
 from .gui import *
 from .registry import *
+from .simulator import *
 from .utils import *
 from .visualization import *
 
@@ -28,7 +29,8 @@ with open(getResource("logging.yaml", ""), "r") as f:
 
 logging.config.dictConfig(log_conf)
 
-# go to correct directory
+# go to correct directory, worker processes start in the one of their parent already
 import sys
-if (dir := os.path.dirname(sys.argv[-1])):
+import multiprocessing
+if (dir := os.path.dirname(sys.argv[-1])) and multiprocessing.parent_process() is None:
     os.chdir(dir)
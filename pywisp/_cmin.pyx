@@ -0,0 +1,152 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+compiled backend of the MIN codec, see :py:mod:`pywisp.min`
+
+Implements the same state machine as the pure python ``Decoder`` and
+``packFrame``, one byte at a time but without the interpreter overhead.
+"""
+from cpython.bytes cimport PyBytes_FromStringAndSize
+from libc.stdint cimport uint8_t, uint32_t
+
+cdef enum:
+    HDR = 0xaa
+    STF = 0x55
+    # id + len + 255 payload + 4 crc
+    MAXFRAME = 261
+    # three header bytes, frame with worst case stuffing and trailing STF
+    MAXWIRE = 3 + 261 + 130 + 1
+
+cdef enum State:
+    ST_ID, ST_LEN, ST_BODY, ST_EOF
+
+cdef uint32_t crcTable[256]
+
+cdef void _initCrcTable():
+    cdef uint32_t c
+    cdef int i, k
+    for i in range(256):
+        c = i
+        for k in range(8):
+            if c & 1:
+                c = (c >> 1) ^ 0xEDB88320
+            else:
+                c = c >> 1
+        crcTable[i] = c
+
+_initCrcTable()
+
+cdef inline uint32_t _crc32(const uint8_t *data, Py_ssize_t n):
+    cdef uint32_t c = 0xffffffff
+    cdef Py_ssize_t i
+    for i in range(n):
+        c = crcTable[(c ^ data[i]) & 0xff] ^ (c >> 8)
+    return c ^ 0xffffffff
+
+
+cdef class Decoder:
+    """ unpack received chunks from wire into (id, data). compiled """
+    cdef object sink
+    cdef int hdr
+    cdef State state
+    cdef Py_ssize_t need
+    cdef Py_ssize_t blen
+    cdef uint8_t buf[MAXFRAME]
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.hdr = 0
+        self.state = ST_ID
+
+    def send(self, data):
+        """ feed a chunk of raw data received from the wire """
+        cdef const uint8_t[:] d = data
+        cdef Py_ssize_t i
+        cdef uint8_t b
+        for i in range(d.shape[0]):
+            b = d[i]
+            if self.hdr == 2:
+                self.hdr = 0
+                if b == STF:
+                    # stuffed HDR HDR within data
+                    self._byte(HDR)
+                    self._byte(HDR)
+                else:
+                    # header (or garbage after HDR HDR), restart frame
+                    self.state = ST_ID
+            elif b == HDR:
+                self.hdr += 1
+            elif self.hdr == 1:
+                self.hdr = 0
+                self._byte(HDR)
+                self._byte(b)
+            else:
+                self._byte(b)
+
+    cdef int _byte(self, uint8_t b) except -1:
+        cdef uint32_t crc
+        if self.state == ST_BODY:
+            self.buf[self.blen] = b
+            self.blen += 1
+            self.need -= 1
+            if self.need:
+                return 0
+            crc = ((<uint32_t>self.buf[self.blen - 4] << 24)
+                   | (<uint32_t>self.buf[self.blen - 3] << 16)
+                   | (<uint32_t>self.buf[self.blen - 2] << 8)
+                   | self.buf[self.blen - 1])
+            if _crc32(self.buf, self.blen - 4) != crc:
+                # dropping frame
+                self.state = ST_ID
+                return 0
+            self.state = ST_EOF
+            self.sink.send((self.buf[0], PyBytes_FromStringAndSize(
+                <char *>self.buf + 2, self.blen - 6)))
+        elif self.state == ST_ID:
+            if b < 64: # not handling transport frames
+                self.buf[0] = b
+                self.state = ST_LEN
+        elif self.state == ST_LEN:
+            self.buf[1] = b
+            self.blen = 2
+            self.need = b + 4
+            self.state = ST_BODY
+        else:
+            # expected EOF==STF, but don't care
+            self.state = ST_ID
+        return 0
+
+
+def packFrame(int id, data):
+    """ pack a single (id, data) frame for transmission on wire. compiled """
+    cdef const uint8_t[:] d = data
+    cdef Py_ssize_t n = d.shape[0]
+    cdef uint8_t pld[MAXFRAME]
+    cdef uint8_t out[MAXWIRE]
+    cdef Py_ssize_t i, o = 3
+    cdef int hdcnt = 0
+    cdef uint32_t crc
+    assert(id < 64)
+    assert(n < 256)
+    pld[0] = id
+    pld[1] = n
+    for i in range(n):
+        pld[i + 2] = d[i]
+    crc = _crc32(pld, n + 2)
+    pld[n + 2] = crc >> 24
+    pld[n + 3] = crc >> 16
+    pld[n + 4] = crc >> 8
+    pld[n + 5] = crc
+    out[0] = out[1] = out[2] = HDR
+    for i in range(n + 6):
+        out[o] = pld[i]
+        o += 1
+        if pld[i] == HDR:
+            hdcnt += 1
+            if hdcnt == 2:
+                out[o] = STF
+                o += 1
+                hdcnt = 0
+        else:
+            hdcnt = 0
+    out[o] = STF
+    return PyBytes_FromStringAndSize(<char *>out, o + 1)
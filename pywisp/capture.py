@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains the recording of raw connection data to capture files.
+
+A capture file starts with a header of magic bytes and the wall clock time of
+the recording start. Each received chunk follows as record of its time since
+the start (float64 seconds, monotonic clock), its length (uint32) and its
+data, all little endian.
+"""
+
+import queue
+import struct
+import time
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+__all__ = ["CaptureWriter", "readCapture"]
+
+MAGIC = b'PWCAP\x01'
+HEADER = struct.Struct('<d')
+RECORD = struct.Struct('<dI')
+
+
+class CaptureWriter(QThread):
+    """
+    Appends raw chunks to a capture file. :py:meth:`append` only timestamps
+    and queues the chunk, the file is written by the thread with large
+    buffered writes, so recording does not hold up the receiving thread.
+    """
+    failed = pyqtSignal(str)
+
+    def __init__(self, path, bufferSize=1 << 20):
+        super().__init__()
+        self.path = path
+        self.bufferSize = bufferSize
+        self.queue = queue.SimpleQueue()
+        self.startTime = time.monotonic()
+
+    def append(self, data):
+        """
+        record a chunk, data is copied as the caller may reuse its buffer
+        """
+        self.queue.put((time.monotonic(), bytes(data)))
+
+    def run(self):
+        try:
+            with open(self.path, 'wb', buffering=self.bufferSize) as f:
+                f.write(MAGIC + HEADER.pack(time.time()))
+                while True:
+                    item = self.queue.get()
+                    if item is None:
+                        break
+                    t, data = item
+                    f.write(RECORD.pack(t - self.startTime, len(data)))
+                    f.write(data)
+        except OSError as e:
+            self.failed.emit(str(e))
+
+    def close(self):
+        """
+        write the remaining chunks and close the file
+        """
+        self.queue.put(None)
+        self.wait()
+
+
+def readCapture(path):
+    """
+    Reads a capture file written by :py:class:`CaptureWriter`
+    :param path: capture file
+    :return: generator of (time, data) tuples, time in seconds since the start
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is no capture file")
+        f.read(HEADER.size)
+        while True:
+            record = f.read(RECORD.size)
+            if len(record) < RECORD.size:
+                # end of file, or the last record was cut off
+                return
+            t, size = RECORD.unpack(record)
+            data = f.read(size)
+            if len(data) < size:
+                return
+            yield t, data
@@ -4,16 +4,48 @@ This module contains all classes and functions related to establishing a connect
 """
 
 import logging
+import queue
 import socket
+import time
 from abc import abstractmethod
 
 import serial
 from PyQt5.QtCore import QObject, QThread, pyqtSignal
 
-from .min import Packer, Unpacker, Frame, Bytewise, HDRStuf
+from .capture import CaptureWriter, readCapture
+from .min import Packer, Frame, Decoder
 from .utils import coroutine, pipe
 
-__all__ = ["Connection", "UdpConnection", "TcpConnection", "SerialConnection", "IACEConnection"]
+__all__ = ["Connection", "UdpConnection", "TcpConnection", "SerialConnection", "IACEConnection", "ReplayConnection"]
+
+
+@coroutine
+def RecordSplitter(sink, size):
+    """
+    split received data into fixed size records of 1 byte id + payload.
+    coroutine
+
+    records are sliced out of the received data by offset, only a record
+    spanning two chunks is collected in a separate buffer. the payload is
+    passed on as memoryview, which is only valid until the sink returns.
+    """
+    rest = bytearray()
+    while True:
+        data = memoryview((yield))
+        pos = 0
+        if rest:
+            pos = min(size - len(rest), len(data))
+            rest += data[:pos]
+            if len(rest) < size:
+                continue
+            sink.send((rest[0], memoryview(rest)[1:]))
+            # the sink may still refer to the old buffer, do not resize it
+            rest = bytearray()
+        end = pos + (len(data) - pos) // size * size
+        for off in range(pos, end, size):
+            sink.send((data[off], data[off + 1:off + size]))
+        if end < len(data):
+            rest += data[end:]
 
 
 class ConnReader(QObject):
@@ -27,10 +59,13 @@ class ConnReader(QObject):
         self.rx = pipe(rx)
 
     def run(self):
+        # all reads go to the same buffer, the rx pipe has to copy what it keeps
+        buf = memoryview(bytearray(self.conn.recvSize))
         while not self.stop:
             try:
-                data = self.conn._recv()
-                self.rx.send(data)
+                n = self.conn._recvInto(buf)
+                if n:
+                    self.rx.send(buf[:n])
             except TimeoutError:
                 # intentionally empty
                 pass
@@ -41,38 +76,199 @@ class ConnReader(QObject):
                 if not self.stop:
                     self.err.emit(f"connection dropped: {repr(e)} / {e}")
                 break
+            # also after timeouts, so a batch does not wait for more traffic
+            self.conn.flushDue()
 
     def quit(self):
         self.stop = True
 
 
+class ConnWriter(QObject):
+    """ Thread worker writing queued data to the connection """
+    err = pyqtSignal(str)
+
+    def __init__(self, conn):
+        super().__init__()
+        self.conn = conn
+        self.stop = False
+        self.queue = queue.Queue()
+
+    def run(self):
+        while not self.stop:
+            data = self.queue.get()
+            if data is None:
+                break
+            try:
+                self.write(data)
+            except TimeoutError:
+                # intentionally empty
+                pass
+            except Exception as e:
+                if not self.stop:
+                    self.err.emit(f"cannot send data: {e}")
+                break
+
+    def write(self, data):
+        """
+        write a single data dict, a list or any other iterable of them.
+        lists are written in one go unless the connection's send rate is
+        limited, other iterables are consumed frame by frame
+        """
+        tx = self.conn.tx
+        if isinstance(data, dict):
+            tx.send((data['id'], data['msg']))
+        elif isinstance(data, list) and not self.conn.sendRate:
+            tx.send([(d['id'], d['msg']) for d in data])
+        else:
+            for d in data:
+                if self.stop:
+                    break
+                tx.send((d['id'], d['msg']))
+
+    def quit(self, discard=False):
+        """
+        end the thread once the queued data is written
+        :param discard: drop the pending data instead, e.g. after an error
+        """
+        if discard:
+            self.stop = True
+            with self.queue.mutex:
+                self.queue.queue.clear()
+        # wake up the thread
+        self.queue.put(None)
+
+
 class Connection(QObject):
     """
     Base class for a connection, i.e. tcp or serial
+
+    By default every received frame is emitted via :py:attr:`received`.
+    If :py:attr:`decoder` is set, it is called with every frame in the reader
+    thread and its result is emitted instead, `None` results are dropped.
+    Setting :py:attr:`batchSize` enables batched delivery, frames are then
+    collected in the reader thread and emitted as list via
+    :py:attr:`receivedBatch` once `batchSize` frames arrived or the oldest
+    one is `batchTime` seconds old.
+
+    :py:attr:`emitted` counts the emitted frames, the application counts the
+    ones it processed in :py:attr:`handled`, their difference is the
+    :py:attr:`backlog` of frames waiting for the application.
+
+    Data passed to :py:meth:`writeData` is queued and written by a separate
+    thread. Setting :py:attr:`sendRate` limits the written bytes per second,
+    e.g. to not overrun the receive buffer of a microcontroller.
+    :py:meth:`disconnect` blocks up to :py:attr:`drainTimeout` seconds while
+    the queued data is written.
+
+    The raw received data can be recorded to a capture file with
+    :py:meth:`startCapture`, see :py:mod:`pywisp.capture`.
     """
-    received = pyqtSignal(Frame)
+    received = pyqtSignal(object)
+    receivedBatch = pyqtSignal(list)
     finished = pyqtSignal()
+    recvSize = 2048
+    batchSize = 0
+    batchTime = 0.02
+    decoder = None
+    sendRate = 0
+    drainTimeout = 1
 
     def __init__(self, rx, tx, *args, **kwargs):
         super().__init__()
         self._logger = logging.getLogger(self.__class__.__name__)
-        self.tx = pipe([tx, self._send])
+        self.tx = pipe([tx, self._pace, self._send])
         thread = QThread()
-        worker = ConnReader(self, [rx, self.emitter])
+        worker = ConnReader(self, [self._tap, rx, self.emitter])
         worker.moveToThread(thread)
         worker.err.connect(self.workerror)
         thread.started.connect(worker.run)
         thread.finished.connect(thread.deleteLater)
         self.thread = thread
         self.worker = worker
+        writerThread = QThread()
+        writer = ConnWriter(self)
+        writer.moveToThread(writerThread)
+        writer.err.connect(self.writeerror)
+        writerThread.started.connect(writer.run)
+        writerThread.finished.connect(writerThread.deleteLater)
+        self.writerThread = writerThread
+        self.writer = writer
         self.connected = False
+        self.capture = None
+        self._batch = []
+        self._batchDeadline = 0
+        # written by the reader thread and the application respectively
+        self.emitted = 0
+        self.handled = 0
+
+    @property
+    def backlog(self):
+        """ number of emitted frames not yet handled by the application """
+        return self.emitted - self.handled
 
     def workerror(self, err):
         self.worker.deleteLater()
-        self.disconnect()
+        self.disconnect(drain=False)
         self._logger.error(err)
         self.finished.emit()
 
+    def writeerror(self, err):
+        self._logger.error(err)
+        if self.connected:
+            self.disconnect(drain=False)
+
+    @coroutine
+    def _tap(self, sink):
+        """
+        hand the received data to the capture, while recording. coroutine.
+        """
+        while True:
+            data = yield
+            capture = self.capture
+            if capture is not None:
+                capture.append(data)
+            sink.send(data)
+
+    def startCapture(self, path):
+        """
+        record the raw received data to a capture file
+        :param path: capture file, is overwritten
+        """
+        self.stopCapture()
+        capture = CaptureWriter(path)
+
+        def failed(msg):
+            if self.capture is capture:
+                self.capture = None
+            self._logger.error(f"capture failed: {msg}")
+
+        capture.failed.connect(failed)
+        capture.start()
+        self.capture = capture
+
+    def stopCapture(self):
+        """
+        stop recording and close the capture file
+        """
+        capture, self.capture = self.capture, None
+        if capture is not None:
+            capture.close()
+
+    @coroutine
+    def _pace(self, sink):
+        """
+        limit the written data to sendRate bytes per second. coroutine.
+        """
+        due = time.monotonic()
+        while True:
+            data = yield
+            if self.sendRate:
+                now = time.monotonic()
+                if due > now:
+                    time.sleep(due - now)
+                due = max(due, now) + len(data) / self.sendRate
+            sink.send(data)
+
     @coroutine
     def emitter(self):
         """
@@ -80,35 +276,75 @@ class Connection(QObject):
         """
         while True:
             id, payload = yield
-            self.received.emit(Frame(id, payload))
+            frame = Frame(id, bytes(payload))
+            if self.decoder is not None:
+                frame = self.decoder(frame)
+                if frame is None:
+                    continue
+            if not self.batchSize:
+                self.emitted += 1
+                self.received.emit(frame)
+                continue
+            if not self._batch:
+                self._batchDeadline = time.monotonic() + self.batchTime
+            self._batch.append(frame)
+            if len(self._batch) >= self.batchSize:
+                self.flush()
+
+    def flush(self):
+        """
+        send collected frames to application
+        """
+        if self._batch:
+            batch, self._batch = self._batch, []
+            self.emitted += len(batch)
+            self.receivedBatch.emit(batch)
+
+    def flushDue(self):
+        """
+        send collected frames to application if the oldest one is overdue
+        """
+        if self._batch and time.monotonic() >= self._batchDeadline:
+            self.flush()
 
     def writeData(self, data):
         """
-        push application data through min
+        queue application data for the writer thread, which pushes it through min.
+        a list of data is handed to the connection as a single write, other
+        iterables like generators are consumed lazily in the writer thread
         """
         if not self.connected:
             return
-        try:
-            self.tx.send((data['id'], data['msg']))
-        except TimeoutError:
-            pass
-        except Exception as e:
-            self._logger.error(f"cannot send data: {e}")
-            self.disconnect()
+        self.writer.queue.put(data)
 
     def connect(self):
         """ establish the connection """
         if self._connect():
             self.thread.start()
+            self.writerThread.start()
             self.connected = True
             return True
 
-    def disconnect(self):
-        """ close the connection, stop worker and thread """
+    def disconnect(self, drain=True):
+        """
+        close the connection, stop worker and thread
+        :param drain: write the queued data before closing, e.g. the stop
+            command of the experiment. this blocks the calling thread, i.e.
+            usually the gui, until the data is written or drainTimeout
+            seconds passed
+        """
         self.connected = False
         self.worker.quit()
+        self.writer.quit(discard=not drain)
+        self.writerThread.quit()
+        if not self.writerThread.wait(int(self.drainTimeout * 1000)):
+            self._logger.warning("discarding data not written before disconnect")
+            self.writer.quit(discard=True)
+            self.writerThread.wait()
         self._disconnect()
         self.thread.quit()
+        self.writerThread.quit()
+        self.stopCapture()
         self.finished.emit()
 
     @abstractmethod
@@ -129,6 +365,17 @@ class Connection(QObject):
         """
         pass
 
+    def _recvInto(self, buf) -> int:
+        """
+        read data from connection into buf and return the number of bytes read.
+        this runs in a threaded loop, buf is reused for every read.
+        defaults to copying the data returned by :py:meth:`_recv`, which must
+        not exceed :py:attr:`recvSize`
+        """
+        data = self._recv()
+        buf[:len(data)] = data
+        return len(data)
+
     @abstractmethod
     @coroutine
     def _send(self):
@@ -141,6 +388,8 @@ class SerialConnection(Connection):
     Simple Serial Connection
     """
 
+    recvSize = 512
+
     supported_baudrates = (
             1200, 1800, 2400, 4800, 9600, 
             19200, 38400, 57600, 
@@ -155,7 +404,7 @@ class SerialConnection(Connection):
                              f"Choose one of {self.supported_baudrates}")
         self.serial.baudrate = baud
         self.serial.port = port
-        super().__init__(tx=Packer, rx=[Bytewise, HDRStuf, Unpacker])
+        super().__init__(tx=Packer, rx=Decoder)
 
     def _connect(self):
         try:
@@ -170,7 +419,10 @@ class SerialConnection(Connection):
         self.serial.close()
 
     def _recv(self):
-        return self.serial.read(512)
+        return self.serial.read(self.recvSize)
+
+    def _recvInto(self, buf):
+        return self.serial.readinto(buf)
 
     @coroutine
     def _send(self):
@@ -205,7 +457,10 @@ class SocketConnection(Connection):
         self.sock.close()
 
     def _recv(self):
-        return self.sock.recv(512*4)
+        return self.sock.recv(self.recvSize)
+
+    def _recvInto(self, buf):
+        return self.sock.recv_into(buf)
 
     @coroutine
     def _send(self):
@@ -222,22 +477,22 @@ class TcpConnection(SocketConnection):
     def __init__(self, ip, port, maxPayload=80, **kwargs):
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
+        def pad(id, data):
+            return bytes([id]) + data + bytes(maxPayload - len(data))
+
         @coroutine
         def Sender(sink):
             """ send 1 byte id + 80 byte payload """
             while True:
-                id, data = (yield)
-                sink.send(bytes([id]) + data + bytes(maxPayload - len(data)))
+                frames = (yield)
+                if isinstance(frames, list):
+                    sink.send(b''.join([pad(id, data) for id, data in frames]))
+                else:
+                    sink.send(pad(*frames))
 
-        @coroutine
         def Receiver(sink):
             """ receive 81 byte chunks -> (1 id + 80 payload) """
-            data = []
-            while True:
-                data.extend((yield))
-                while len(data) >= maxPayload + 1:
-                    f, data = data[:maxPayload + 1], data[maxPayload + 1:]
-                    sink.send((f[0], bytes(f[1:])))
+            return RecordSplitter(sink, maxPayload + 1)
 
         super().__init__(sock, ip, port, tx=Sender, rx=Receiver, **kwargs)
 
@@ -249,8 +504,128 @@ class UdpConnection(SocketConnection):
 
     def __init__(self, ip, port, **kwargs):
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        super().__init__(sock, ip, port, tx=Packer, rx=[Bytewise, HDRStuf, Unpacker], **kwargs)
+        super().__init__(sock, ip, port, tx=Packer, rx=Decoder, **kwargs)
 
 class IACEConnection(UdpConnection):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+
+
+class ReplayConnection(Connection):
+    """
+    Replays a capture file through the receiving pipeline, see
+    :py:mod:`pywisp.capture`. The recorded chunks are delivered with their
+    recorded timing divided by `speed`, a speed of 0 replays as fast as
+    possible. Like a test rig, the connection only delivers data between the
+    start and stop command of an experiment (frame id 1), the recorded timing
+    restarts at every start. Other written data is discarded.
+    """
+
+    recvSize = 1 << 16
+
+    def __init__(self, path, speed=1.0, maxPayload=None, timeout=0.01):
+        """
+        :param path: capture file
+        :param speed: replay speed relative to the recording, 0 for maximum speed
+        :param maxPayload: payload size of recorded tcp records, min frames if None
+        :param timeout: longest time to wait for data in a single read
+        """
+        self.path = path
+        self.speed = speed
+        self.timeout = timeout
+        self._records = None
+        self._pending = None
+        self._time = 0
+        self._due = 0
+        self._startTime = 0
+        self._running = False
+        if maxPayload is None:
+            rx = Decoder
+        else:
+            def rx(sink):
+                return RecordSplitter(sink, maxPayload + 1)
+        super().__init__(tx=Packer, rx=rx)
+
+    def _connect(self):
+        try:
+            self._records = readCapture(self.path)
+            self._running = False
+            # reads the header, so a broken file fails here
+            self._next()
+        except (OSError, ValueError) as e:
+            self._logger.error(f'cannot replay: {e}')
+            return False
+        return True
+
+    def _disconnect(self):
+        if self._records is not None:
+            self._records.close()
+            self._records = None
+        self._pending = None
+
+    def _next(self):
+        """ fetch the next recorded chunk and the time it is due """
+        record = next(self._records, None)
+        if record is None:
+            self._logger.info(f"replay of {self.path} finished")
+            self._disconnect()
+            return
+        self._time, data = record
+        self._pending = memoryview(data)
+        self._due = self._startTime + self._time / self.speed if self.speed else 0
+
+    def _start(self):
+        """ continue the replay with the pending chunk, which is due now """
+        if self.speed:
+            self._startTime = time.monotonic() - self._time / self.speed
+            self._due = time.monotonic()
+        self._running = True
+
+    def _recv(self):
+        buf = bytearray(self.recvSize)
+        return bytes(buf[:self._recvInto(buf)])
+
+    def _recvInto(self, buf):
+        if not self._running:
+            # no experiment running, hold the stream
+            time.sleep(self.timeout)
+            return 0
+        n = 0
+        while n < len(buf) and self._pending is not None:
+            wait = self._due - time.monotonic()
+            if wait > 0:
+                if n:
+                    break
+                if wait > self.timeout:
+                    # like a socket timeout, return to the reader loop now and then
+                    time.sleep(self.timeout)
+                    return 0
+                time.sleep(wait)
+            size = min(len(buf) - n, len(self._pending))
+            buf[n:n + size] = self._pending[:size]
+            self._pending = self._pending[size:]
+            n += size
+            if not self._pending:
+                self._next()
+        if self._pending is None and not n:
+            # replay finished
+            time.sleep(self.timeout)
+        return n
+
+    @coroutine
+    def _command(self):
+        """
+        start and stop the replay with the experiment. coroutine.
+        """
+        while True:
+            id, payload = yield
+            if id != 1 or not payload or payload[0] & 2:
+                # no command or just the heartbeat
+                continue
+            if payload[0] & 1:
+                self._start()
+            else:
+                self._running = False
+
+    def _send(self):
+        return pipe([Decoder, self._command])
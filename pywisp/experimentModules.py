@@ -30,7 +30,11 @@ class ExperimentModule(QObject, metaclass=ExperimentModuleMeta):
     via the :py:attr:`settings` property.
     The :py:attr:`dataPoints` are accessible by the GUI for plotting.
     The :py:attr:`connection` determines the connection interface.
+    The optional :py:attr:`frameIds` lists the ids of the frames consumed by
+    :py:meth:`handleFrame`, which are then dispatched directly to this module.
+    Modules without it are offered every frame of their connection.
     """
+    frameIds = None
     def __init__(self):
         QObject.__init__(self, None)
         self._logger = logging.getLogger(self.__class__.__name__)
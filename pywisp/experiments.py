@@ -69,6 +69,8 @@ class PropertyItem(QStandardItem):
         else:
             raise NotImplementedError
 
+        self.emitDataChanged()
+
     def data(self, role=None, *args, **kwargs):
         if role == Qt.DisplayRole:
             return self._text
@@ -129,18 +131,30 @@ class ExperimentInteractor(QObject):
     expStop = pyqtSignal()
     sendData = pyqtSignal(object)
     missedbeat = pyqtSignal()
+    streamFailed = pyqtSignal(str)
 
     def __init__(self, targetView, parent=None):
         QObject.__init__(self, parent)
         self._logger = logging.getLogger(self.__class__.__name__)
         self.targetView = targetView
+        # errors of parameter streams arrive from the connections' writer threads
+        self.streamFailed.connect(self._streamFailed)
         self.dataPoints = None
         self.runningExperiment = False
         # create model
         self.targetModel = ExperimentModel(self)
         self.targetModel.itemChanged.connect(self.itemChanged)
+        # module settings as read from the model, keyed by module name
+        self._settingsCache = {}
+        self.targetModel.dataChanged.connect(self._invalidateSettings)
+        self.targetModel.rowsInserted.connect(self._clearSettings)
+        self.targetModel.rowsRemoved.connect(self._clearSettings)
+        self.targetModel.modelReset.connect(self._clearSettings)
         # parameter change settings
         self.modSets = {}
+        # modules decoding frames, snapshot taken at experiment start
+        self.frameDispatch = {}
+        self.frameFallback = {}
 
     def _addSettings(self, moduleName, parent):
         """
@@ -192,6 +206,21 @@ class ExperimentInteractor(QObject):
         moduleName = parent.data(role=PropertyItem.RawDataRole)
         self._addSettings(moduleName, parent)
 
+    def _invalidateSettings(self, index, *args):
+        """
+        Drops the cached settings of the module a changed item belongs to.
+        :param index: index of the changed item
+        """
+        parent = index.parent()
+        if not parent.isValid():
+            self._clearSettings()
+            return
+        name = self.targetModel.data(parent, role=PropertyItem.RawDataRole)
+        self._settingsCache.pop(name, None)
+
+    def _clearSettings(self, *args):
+        self._settingsCache.clear()
+
     def getSettings(self, item):
         """
         Returns a dict with all settings of the item of an experiment.
@@ -361,15 +390,50 @@ class ExperimentInteractor(QObject):
             self._logger.warn("rig missed heartbeat! disconnecting...")
             self.missedbeat.emit()
             return None
-        for mod, _, _ in self.activeModules():
-            if mod.connection != connection:
-                continue
+        return self.decodeFrame(frame, connection)
+
+    def decodeFrame(self, frame, connection):
+        """
+        Returns the corresponding data points of a frame of the test rig.
+        This only uses the modules of the running experiment and does not
+        touch the Qt model, so it may be called from the connection's reader
+        thread.
+        :param frame: data from the test rig
+        :param connection: connection of the frame
+        :return: data points, the frame itself if it has to be handled by
+            :py:meth:`handleFrame` or None if nothing found
+        """
+        if frame.id == 1:
+            return frame
+        for mod in self.frameDispatch.get((connection, frame.id), ()):
+            dataPoints = mod.handleFrame(mod,frame)
+            if dataPoints:
+                return dataPoints
+        for mod in self.frameFallback.get(connection, ()):
             dataPoints = mod.handleFrame(mod,frame)
             if dataPoints:
                 return dataPoints
 
         return None
 
+    def _buildFrameDispatch(self, modules):
+        """
+        Maps (connection, frame id) to the modules consuming these frames.
+        Modules that do not declare their `frameIds` are collected per
+        connection and get offered all remaining frames.
+        :param modules: experiment modules of the running experiment
+        """
+        dispatch = {}
+        fallback = {}
+        for mod in modules:
+            if mod.frameIds is None:
+                fallback.setdefault(mod.connection, []).append(mod)
+                continue
+            for id in mod.frameIds:
+                dispatch.setdefault((mod.connection, id), []).append(mod)
+        self.frameDispatch = dispatch
+        self.frameFallback = fallback
+
     def updateSendParameter(self, module, parameter, value):
         if module in self.modSets:
             self.modSets[module][parameter] = value
@@ -378,20 +442,24 @@ class ExperimentInteractor(QObject):
         """
         Sends all start parameters of all modules that are registered in the target model to start an experiment and
         adds and frame with id 1 and payload 1 as general start command.
+        Modules may return generators of parameter frames, these are streamed
+        to the connection in order instead of being collected up front.
         """
-        data = []
+        chunks = [[]]
+        modules = []
         self.runningExperiment = True
         try:
             for mod, name, settings in self.activeModules():
 
+                modules.append(mod)
                 self.modSets[name] = cp.copy(settings)
                 vals = list(settings.values())
 
                 startParams = mod.getStartParams(mod,vals)
-                data.extend(self.paramsToConnData(startParams, mod.connection))
+                self._addConnData(chunks, startParams, mod.connection)
 
                 params = mod.getParams(mod,vals)
-                data.extend(self.paramsToConnData(params, mod.connection))
+                self._addConnData(chunks, params, mod.connection)
 
         except ExperimentModuleException as eme:
             self._logger.error(eme)
@@ -400,13 +468,28 @@ class ExperimentInteractor(QObject):
             self.expStop.emit()
             return
 
+        self._buildFrameDispatch(modules)
+
         # start experiment
         payload = bytes([1])
 
-        data.append({'id': 1,
-                     'msg': payload})
-        for _data in data:
-            self.sendData.emit(_data)
+        chunks[-1].append({'id': 1,
+                           'msg': payload})
+        for chunk in chunks:
+            if chunk:
+                self.sendData.emit(chunk)
+
+    def _addConnData(self, chunks, params, conn):
+        """
+        Appends the parameter frames to the last list of chunks, a stream of
+        frames is added as separate chunk to keep the order of all frames.
+        """
+        data = self.paramsToConnData(params, conn)
+        if isinstance(data, list):
+            chunks[-1].extend(data)
+        else:
+            chunks.append({'connection': conn, 'frames': data})
+            chunks.append([])
 
     def sendChangedParameterExperiment(self):
         """
@@ -422,8 +505,8 @@ class ExperimentInteractor(QObject):
             params = mod.getParams(mod,vals)
             data.extend(self.paramsToConnData(params, mod.connection))
 
-        for _data in data:
-            self.sendData.emit(_data)
+        if data:
+            self.sendData.emit(data)
 
     def sendParameterExperiment(self):
         """
@@ -436,8 +519,8 @@ class ExperimentInteractor(QObject):
             params = mod.getParams(mod,vals)
             data.extend(self.paramsToConnData(params, mod.connection))
 
-        for _data in data:
-            self.sendData.emit(_data)
+        if data:
+            self.sendData.emit(data)
 
     def stopExperiment(self, broadcast=True):
         """
@@ -463,8 +546,7 @@ class ExperimentInteractor(QObject):
 
             data.append({'id': 1,
                          'msg': payload})
-            for _data in data:
-                self.sendData.emit(_data)
+            self.sendData.emit(data)
 
         self.expFinished.emit()
 
@@ -476,22 +558,33 @@ class ExperimentInteractor(QObject):
         exp = {'Name': self.targetModel.getName()}
 
         for _, name, settings in self.activeModules():
-            exp[name] = settings
+            exp[name] = cp.copy(settings)
 
         return exp
 
     def activeModules(self):
+        """
+        Yields module class, name and settings of all modules in the target
+        model. Settings are only read from the model again after they changed,
+        so they must not be modified by the caller.
+        """
+        modules = getRegisteredExperimentModules()
         for row in range(self.targetModel.rowCount()):
             index = self.targetModel.index(row, 0)
-            parent = index.model().itemFromIndex(index)
-            settings = self.getSettings(parent)
-            name = parent.data(role=PropertyItem.RawDataRole)
-            mod = getRegisteredExperimentModules()[name]
-            yield mod, name, settings
+            name = self.targetModel.data(index, role=PropertyItem.RawDataRole)
+            settings = self._settingsCache.get(name)
+            if settings is None:
+                parent = self.targetModel.itemFromIndex(index)
+                settings = self.getSettings(parent)
+                self._settingsCache[name] = settings
+            yield modules[name], name, settings
 
     def paramsToConnData(self, params, conn):
             if not params:
                 return []
+            if not isinstance(params, (list, dict)):
+                # generators and other iterables are tagged lazily
+                return self._tagConnData(params, conn)
             data = []
             if not isinstance(params, list):
                 params = [params]
@@ -499,3 +592,24 @@ class ExperimentInteractor(QObject):
                 p['connection'] = conn
                 data.append(p)
             return data
+
+    def _tagConnData(self, params, conn):
+        """
+        tag a stream of parameter frames with the connection. the stream is
+        consumed in the writer thread of the connection, so its errors are
+        reported via streamFailed and end the stream
+        """
+        try:
+            for p in params:
+                p['connection'] = conn
+                yield p
+        except Exception as e:
+            self.streamFailed.emit(f"sending parameters to {conn} failed: {e}")
+
+    def _streamFailed(self, msg):
+        """
+        stop the running experiment after a parameter stream failed
+        """
+        self._logger.error(msg)
+        if self.runningExperiment:
+            self.expStop.emit()
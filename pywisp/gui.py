@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 import logging
 import os
+import shutil
+import tempfile
 import time
 import importlib.metadata
 from copy import deepcopy
@@ -34,10 +36,11 @@ from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
 from pyqtgraph.dockarea import *
 
-from .connection import SerialConnection, SocketConnection, IACEConnection
+from .connection import SerialConnection, SocketConnection, IACEConnection, ReplayConnection
 from .experiments import ExperimentInteractor, ExperimentView
+from .min import Frame
 from .registry import *
-from .utils import getResource, PlainTextLogger, DataPointBuffer, Exporter, DataIntDialog, \
+from .utils import getResource, PlainTextLogger, RefreshScheduler, DataPointBuffer, SampleTable, SpillFile, StoreThread, Exporter, DataIntDialog, \
     DataTcpIpDialog, RemoteWidgetEdit, FreeLayout, MovablePushButton, MovableSwitch, MovableSlider, PinnedDock, \
     ContextLineEditAction, TreeWidgetStyledItemDelegate, IACEConnDialog
 
@@ -66,7 +69,11 @@ class MainGui(QMainWindow):
 
         # general config parameters
         self.config = {'TimerTime': 40, # [] = ms
+                       'TimerTimeMax': 500, # [] = ms
                        'HeartbeatTime': 0,
+                       'RetentionTime': 0, # [] = s, 0 keeps all data
+                       'RetentionSize': 0, # [] = samples, 0 keeps all data
+                       'RetentionSpill': False, # writes the dropped data to disk
                        }
         self.configDefaults = self.config.copy()
         QStyleSheet = """
@@ -99,6 +106,7 @@ class MainGui(QMainWindow):
 
         self.timer = QTimer()
         self.timer.timeout.connect(self.updateDataPlots)
+        self.refreshScheduler = None
         self.heartbeatTimer = QTimer()
         self.heartbeatTimer.timeout.connect(self.heartbeat)
 
@@ -215,6 +223,9 @@ class MainGui(QMainWindow):
         self.lastMeasDock.addWidget(self.lastMeasList)
         self.lastMeasList.itemDoubleClicked.connect(self.loadLastMeas)
         self.measurements = []
+        self._measurementDir = None
+        self._measurementDirTemp = False
+        self._storeThreads = []
 
         # log dock
         self.logBox = QTextEdit(self)
@@ -346,6 +357,10 @@ class MainGui(QMainWindow):
         # animation
         self.actSaveAnimation = QAction("&Save Animation", self, checkable=True)
         self.optMenu.addAction(self.actSaveAnimation)
+        # raw data capture
+        self.actCapture = QAction("&Capture raw data", self, checkable=True)
+        self.optMenu.addAction(self.actCapture)
+        self.actCapture.toggled.connect(self.setCapture)
 
         # experiment
         self.expMenu = self.menuBar().addMenu('&Experiment')
@@ -375,6 +390,9 @@ class MainGui(QMainWindow):
             elif issubclass(cls, SocketConnection):
                 actTcp = self.connMenu.addAction(name)
                 actTcp.triggered.connect(lambda _, settings=cls.settings: self._getTcpMenu(settings))
+            elif issubclass(cls, ReplayConnection):
+                replayMenu = self.connMenu.addMenu(name)
+                self._getReplayMenu(replayMenu, cls.settings)
             else:
                 self._logger.warning("Cannot handle the connection type!")
             self.connMenu.addSeparator()
@@ -429,6 +447,7 @@ class MainGui(QMainWindow):
         self._currentExpListItem = None
         self._currentLastMeasItem = None
         self._currentDataPointBuffers = None
+        self._currentSampleTables = {}
         self.plotCharts = {}
 
         loadExpFromFileSuccess = self.loadExpFromFile(fileName)
@@ -496,6 +515,48 @@ class MainGui(QMainWindow):
 
         return serialMenu
 
+    def _getReplayMenu(self, replayMenu, settings):
+        # capture file
+        actFile = replayMenu.addAction("Capture file ...")
+        actFile.triggered.connect(lambda: self.getReplayFile(settings))
+
+        # speed
+        speedMenu = replayMenu.addMenu("Speed")
+        speedMenu.aboutToShow.connect(lambda: self.getReplaySpeeds(settings, speedMenu))
+
+        return replayMenu
+
+    def getReplayFile(self, settings):
+        """
+        Selects the capture file of a replay connection
+        :param settings: replay connection settings
+        """
+        path, _ = QFileDialog.getOpenFileName(self, "Replay capture file", settings['file'],
+                                              "Capture (*.pwcap)")
+        if path:
+            settings['file'] = path
+
+    def getReplaySpeeds(self, settings, connMenu):
+        """
+        Sets the speed in replay connection menu
+        :param settings: replay connection settings
+        :param connMenu: replay speed menu
+        """
+
+        def setSpeed(speed):
+            def fn():
+                settings['speed'] = speed
+
+            return fn
+
+        connMenu.clear()
+        for speed, text in [(1, "Real time"), (2, "2x"), (10, "10x"), (0, "Maximum")]:
+            speedAction = QAction(text, self)
+            speedAction.setCheckable(True)
+            speedAction.setChecked(settings['speed'] == speed)
+            speedAction.triggered.connect(setSpeed(speed))
+            connMenu.addAction(speedAction)
+
     def getBauds(self, settings, connMenu):
         """
         Sets the baud rate in serial connection menu
@@ -746,10 +807,12 @@ class MainGui(QMainWindow):
         self._logger.info(f"Measurements selected for export are: {exp_lbls}")
         dataPoints = {lbl: dataPointBuffers[lbl] for lbl in exp_lbls}
 
-        self.data_mutex.lock()
-        expData = deepcopy(dataPoints)
-        self.data_mutex.unlock()
-        self.exporter = Exporter(dataPoints=expData)
+        if dataPointBuffers is self._currentDataPointBuffers:
+            # still being recorded, finished measurements are not changed anymore
+            self.data_mutex.lock()
+            dataPoints = deepcopy(dataPoints)
+            self.data_mutex.unlock()
+        self.exporter = Exporter(dataPoints=dataPoints)
         self.exporter.done.connect(self.exportDone)
         self.exporter.runExport()
 
@@ -932,14 +995,21 @@ class MainGui(QMainWindow):
 
         if dataPointNames:
             self._currentDataPointBuffers = dict()
-            for data in dataPointNames:
-                self._currentDataPointBuffers[data] = DataPointBuffer()
+            self._currentSampleTables = dict()
+            spillDir = None
+            if self.config['RetentionSpill']:
+                spillDir = tempfile.mkdtemp(prefix="spill-", dir=self.getMeasurementDir())
+            for i, data in enumerate(dataPointNames):
+                spill = SpillFile(os.path.join(spillDir, '{}.bin'.format(i))) if spillDir else None
+                self._currentDataPointBuffers[data] = DataPointBuffer(spill=spill, **self._retention())
         else:
             return
 
         data = {}
         data.update({'dataPointBuffers': self._currentDataPointBuffers})
         data.update({'exp': deepcopy(self.exp.getExperiment())})
+        if spillDir:
+            data.update({'spillDir': spillDir})
         self.measurements.append(data)
 
         item = QListWidgetItem(str(self.lastMeasList.count() + 1) + ": "
@@ -948,9 +1018,10 @@ class MainGui(QMainWindow):
         self.lastMeasList.scrollToItem(item)
         self.copyLastMeas(item)
 
-        # cap the plot updates at 25 fps
-        timeout = max(int(self.config['TimerTime']), 40)
-        self.timer.start(timeout)
+        # plot update interval adapts between TimerTime, but at least 40 ms, and TimerTimeMax
+        self.refreshScheduler = RefreshScheduler(max(int(self.config['TimerTime']), 40),
+                                                 int(self.config['TimerTimeMax']))
+        self.timer.start(self.refreshScheduler.interval)
         if self.config['HeartbeatTime']:
             self.heartbeatTimer.start(int(self.config['HeartbeatTime']))
         self.exp.runExperiment()
@@ -1212,6 +1283,17 @@ class MainGui(QMainWindow):
             self._logger.warn("Export in progress, waiting!")
             self.exporter.wait()
         logging.getLogger().removeHandler(self.textLogger)
+        for thread in list(self._storeThreads):
+            thread.wait()
+        # measurements are not kept across sessions, so their files are removed with them
+        paths = [measurement[key] for measurement in self.measurements
+                 for key in ('path', 'spillDir') if key in measurement]
+        self.measurements.clear()
+        if self._measurementDirTemp:
+            shutil.rmtree(self._measurementDir, ignore_errors=True)
+        else:
+            for path in paths:
+                shutil.rmtree(path, ignore_errors=True)
         super().closeEvent(QCloseEvent)
 
     @pyqtSlot()
@@ -1229,8 +1311,12 @@ class MainGui(QMainWindow):
                     self.actStartExperiment.setEnabled(True)
                 self.actStopExperiment.setEnabled(False)
                 self.statusbarLabel.setText("Connected!")
-                connInstance.received.connect(lambda frame: self.updateData(frame, name))
+                connInstance.decoder = lambda frame, name=name: self.exp.decodeFrame(frame, name)
+                connInstance.received.connect(lambda frame, name=name: self.updateData(frame, name))
+                connInstance.receivedBatch.connect(lambda frames, name=name: self.updateDataBatch(frames, name))
                 connInstance.finished.connect(self.disconnect)
+                if self.actCapture.isChecked():
+                    self.startCapture(connInstance, name)
                 self.connections[name]['inst'] = connInstance
                 self.isConnected = True
             else:
@@ -1238,12 +1324,54 @@ class MainGui(QMainWindow):
                 self.isConnected = False
                 return
 
+    def startCapture(self, connInstance, name):
+        """
+        Records the raw data received by a connection to a capture file in the
+        capture directory.
+        :param connInstance: connection
+        :param name: name of the connection
+        """
+        path = self._settings.value("path/capture_dir")
+        os.makedirs(path, exist_ok=True)
+        fileName = os.path.join(path, "{}-{}.pwcap".format(time.strftime("%Y%m%d-%H%M%S"), name))
+        connInstance.startCapture(fileName)
+        self._logger.info(f"Capturing {name} to {fileName}")
+
+    @pyqtSlot(bool)
+    def setCapture(self, enabled):
+        """
+        Starts or stops the capture of all established connections.
+        """
+        for name, conn in self.connections.items():
+            connInstance = conn.get('inst', None)
+            if connInstance is None or not connInstance.connected:
+                continue
+            if enabled:
+                self.startCapture(connInstance, name)
+            else:
+                connInstance.stopCapture()
+
     def writeToConnection(self, data):
         """
         PySignal function, that sends the given data to the connections
-        :param data: to send data
+        :param data: to send data, or list of data that is written to each
+            connection in one go, or dict of a connection name and an
+            iterable of `frames` that is streamed to that connection
         """
-        if data['id'] == 1:
+        if 'frames' in data:
+            self.connections[data['connection']]['inst'].writeData(data['frames'])
+        elif isinstance(data, list):
+            batches = {name: [] for name in self.connections}
+            for _data in data:
+                if _data['id'] == 1:
+                    for batch in batches.values():
+                        batch.append(_data)
+                else:
+                    batches[_data['connection']].append(_data)
+            for name, batch in batches.items():
+                if batch:
+                    self.connections[name]['inst'].writeData(batch)
+        elif data['id'] == 1:
             for conn in self.connections.values():
                 conn['inst'].writeData(data)
         else:
@@ -1283,29 +1411,106 @@ class MainGui(QMainWindow):
         return list
 
     def updateData(self, frame, connection):
-        data = self.exp.handleFrame(frame, connection)
-        if data is None:
-            return
-        time = data['Time'] / 1000.0
-        dataPoints = data['DataPoints']
-        names = data['DataPoints'].keys()
+        self.updateDataBatch([frame], connection)
 
+    def updateDataBatch(self, frames, connection):
+        """
+        Handles a list of frames received from a connection in one go
+        :param frames: received frames or data points already decoded in the
+            connection's reader thread
+        :param connection: name of the connection
+        """
+        time = None
         self.data_mutex.lock()
-        for key in names:
-            self._currentDataPointBuffers[key].addValue(time, dataPoints[key])
+        for data in frames:
+            if isinstance(data, Frame):
+                data = self.exp.handleFrame(data, connection)
+                if data is None:
+                    continue
+            time = data['Time'] / 1000.0
+            self._storeData(time, data['DataPoints'])
         self.data_mutex.unlock()
 
+        conn = self.connections.get(connection, {}).get('inst')
+        if conn is not None:
+            conn.handled += len(frames)
+
+        if time is None:
+            return
         time_text = "Exp time={}".format(timeString(time))
         self.expTimeLabel.setText(time_text)
 
+    def _retention(self):
+        """
+        Returns the configured retention limits of the measurement buffers
+        """
+        return {'maxTime': float(self.config['RetentionTime']),
+                'maxSize': int(self.config['RetentionSize'])}
+
+    def _storeData(self, time, dataPoints):
+        """
+        Stores the data points of one frame in their sample table, or one by
+        one if they cannot share a table
+        :param time: time(stamp) of the frame in s
+        :param dataPoints: dict of data point names and values
+        """
+        names = tuple(dataPoints)
+        table = self._currentSampleTables.get(names)
+        if table is None:
+            table = self._createSampleTable(names)
+        if table is not False:
+            table.addRow(time, dataPoints.values())
+            return
+        for key in dataPoints:
+            buf = self._currentDataPointBuffers[key]
+            if buf.table is not None:
+                # the buffer leaves its table, so frames with it must not go there anymore
+                for tableNames in self._currentSampleTables:
+                    if key in tableNames:
+                        self._currentSampleTables[tableNames] = False
+            buf.addValue(time, dataPoints[key])
+
+    def _createSampleTable(self, names):
+        """
+        Creates the sample table for frames carrying the given data points and
+        binds their buffers to it
+        :param names: names of the data points, ordered like in the frame
+        :return: the table or False, if some data point is already stored elsewhere
+        """
+        buffers = [self._currentDataPointBuffers[name] for name in names]
+        if any(len(buf) or buf.table is not None for buf in buffers):
+            table = False
+        else:
+            table = SampleTable(names, spills={name: buf.spill for name, buf in zip(names, buffers)},
+                                **self._retention())
+            for name, buf in zip(names, buffers):
+                buf.bind(table, name)
+        self._currentSampleTables[names] = table
+        return table
+
     def updateDataPlots(self):
+        """
+        Redraws the visualizer and the plots, the time needed for that and the
+        backlog of received frames determine the next refresh interval
+        """
+        t0 = time.perf_counter()
         if self.visualizer:
             self.visualizer.update(self._currentDataPointBuffers)
             if self.vtkWidget is not None:
                 self.vtkWidget.GetRenderWindow().GetInteractor().Render()
 
         for lbl, chart in self.plotCharts.items():
-            chart.updateCurves(self._currentDataPointBuffers)
+            # charts in docks hidden behind other tabs are updated once shown
+            if chart.isVisible():
+                chart.updateCurves(self._currentDataPointBuffers)
+            else:
+                chart.pendingData = self._currentDataPointBuffers
+
+        if self.refreshScheduler is not None and self.timer.isActive():
+            backlog = sum(conn['inst'].backlog for conn in self.connections.values() if 'inst' in conn)
+            interval = self.refreshScheduler.update(1000 * (time.perf_counter() - t0), backlog)
+            if interval != self.timer.interval():
+                self.timer.setInterval(interval)
 
     def heartbeat(self):
         self.writeToConnection({'id': 1,
@@ -1336,7 +1541,53 @@ class MainGui(QMainWindow):
         item.setText(item.text().replace(' ~current~', ''))
 
         idx = self.lastMeasList.row(item)
-        self.measurements[idx].update({'dataPointBuffers': deepcopy(self._currentDataPointBuffers)})
+        measurement = self.measurements[idx]
+
+        # hand the live buffers over to the measurement and collect late frames in fresh ones
+        dataPointBuffers = self._currentDataPointBuffers
+        measurement.update({'dataPointBuffers': dataPointBuffers})
+        self.data_mutex.lock()
+        self._currentDataPointBuffers = {name: DataPointBuffer(**self._retention())
+                                         for name in dataPointBuffers}
+        self._currentSampleTables = dict()
+        self.data_mutex.unlock()
+        for buf in dataPointBuffers.values():
+            if buf.spill is not None:
+                buf.spill.close()
+
+        # move the frozen buffers to disk in the background
+        thread = StoreThread(dataPointBuffers, self.getMeasurementDir())
+
+        def stored(buffers):
+            measurement.update({'dataPointBuffers': buffers, 'path': thread.path})
+            # the spilled data is part of the stored files now
+            if 'spillDir' in measurement:
+                shutil.rmtree(measurement.pop('spillDir'), ignore_errors=True)
+
+        def failed(msg):
+            self._logger.error("Could not store measurement on disk, keeping it in memory: {}".format(msg))
+
+        thread.stored.connect(stored)
+        thread.failed.connect(failed)
+        thread.finished.connect(lambda: self._storeThreads.remove(thread))
+        self._storeThreads.append(thread)
+        thread.start()
+
+    def getMeasurementDir(self):
+        """
+        Returns the directory finished measurements are stored in. If none is
+        configured, a temporary directory is used, which is removed on exit.
+        Otherwise only the files of the measurements are removed on exit.
+        """
+        if self._measurementDir is None:
+            path = self._settings.value("path/measurement_dir")
+            if path:
+                os.makedirs(path, exist_ok=True)
+                self._measurementDir = path
+            else:
+                self._measurementDir = tempfile.mkdtemp(prefix="pywisp-")
+                self._measurementDirTemp = True
+        return self._measurementDir
 
     def copyLastMeas(self, item):
         self._currentLastMeasItem = item
@@ -1,4 +1,5 @@
 
+import re
 from binascii import crc32
 from struct import pack as spack
 
@@ -6,6 +7,12 @@ from .utils import coroutine
 
 HDR = 0xaa
 STF = 0x55
+_HDR1 = bytes([HDR])
+_HDR2 = bytes([HDR, HDR])
+_HDR2RE = re.compile(re.escape(_HDR2))
+_HDR3 = bytes([HDR, HDR, HDR])
+_HDR2STF = bytes([HDR, HDR, STF])
+_STF1 = bytes([STF])
 
 class Frame:
     def __init__(self, id, data):
@@ -38,28 +45,32 @@ def Bytewise(sink):
         for d in data:
             sink.send(d)
 
+def packFrame(id, data):
+    """ pack a single (id, data) frame for transmission on wire """
+    assert(id < 64)
+    assert(len(data) < 256)
+    pld = bytes([id, len(data)]) + data
+    pld += spack('>I', crc32(pld))
+    # stuff every run of two HDR bytes within the frame
+    return _HDR3 + pld.replace(_HDR2, _HDR2STF) + _STF1
+
+def packFrames(frames):
+    """ pack an iterable of (id, data) frames into one buffer """
+    return b''.join([packFrame(id, data) for id, data in frames])
+
 @coroutine
 def Packer(sink):
-    """ pack received (id, data) for transmission on wire. coroutine """
+    """
+    pack received (id, data) for transmission on wire. coroutine
+    a list of (id, data) is packed into a single buffer, which is passed on as
+    one write.
+    """
     while True:
-        id, data = (yield)
-        assert(id < 64)
-        assert(len(data) < 256)
-        pld = bytes([id, len(data)]) + data
-        crc = crc32(pld)
-        ret = bytearray([HDR,HDR,HDR])
-        hdcnt = 0
-        for b in pld+spack('>I', crc):
-            ret.append(b)
-            if b == HDR:
-                hdcnt += 1
-                if hdcnt == 2:
-                    ret.append(STF)
-                    hdcnt = 0
-            else:
-                hdcnt = 0
-        ret.append(STF)
-        sink.send( bytes(ret) )
+        frames = (yield)
+        if isinstance(frames, list):
+            sink.send(packFrames(frames))
+        else:
+            sink.send(packFrame(*frames))
 
 @coroutine
 def HDRStuf(sink):
@@ -120,3 +131,105 @@ def Unpacker(sink):
         eof, ok = (yield)
         if eof != STF: # expected EOF==STF, but don't care
             pass
+
+class Decoder:
+    """
+    unpack received chunks from wire into (id, data).
+
+    Drop-in replacement for the ``[Bytewise, HDRStuf, Unpacker]`` pipe, which
+    handles the chunks returned by ``_recv`` as a whole instead of passing
+    every single byte through three coroutines. Header runs are located with
+    a regex search directly on the received buffer, the data in between is
+    copied in bulk. Chunks may be a memoryview into a reused receive buffer,
+    nothing refers to them after :py:meth:`send` returns.
+    """
+    ID, LEN, BODY, EOF = range(4)
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.tail = b''
+        self.state = self.ID
+        self.need = 0
+        self.buf = bytearray()
+
+    def send(self, data):
+        """ feed a chunk of raw data received from the wire """
+        if self.tail:
+            data = self.tail + data
+            self.tail = b''
+        mv = memoryview(data)
+        pos = 0
+        while True:
+            m = _HDR2RE.search(mv, pos)
+            if m is None:
+                if pos < len(mv) and mv[-1] == HDR:
+                    # lone HDR at the end, decide once the next byte arrives
+                    self._feed(mv[pos:-1])
+                    self.tail = _HDR1
+                else:
+                    self._feed(mv[pos:])
+                return
+            p = m.start()
+            if p + 2 >= len(mv):
+                self._feed(mv[pos:p])
+                self.tail = _HDR2
+                return
+            if mv[p + 2] == STF:
+                # stuffed HDR HDR within data
+                self._feed(mv[pos:p + 2])
+            else:
+                # header (or garbage after HDR HDR), restart frame
+                self._feed(mv[pos:p])
+                self.state = self.ID
+            pos = p + 3
+
+    def _feed(self, data):
+        """ run unstuffed data through the frame state machine """
+        i, n = 0, len(data)
+        buf = self.buf
+        while i < n:
+            state = self.state
+            if state == self.BODY:
+                k = min(self.need, n - i)
+                buf += data[i:i + k]
+                i += k
+                self.need -= k
+                if self.need:
+                    continue
+                crc = int.from_bytes(buf[-4:], 'big')
+                pld = bytes(buf[2:-4])
+                if crc32(memoryview(buf)[:-4]) != crc:
+                    # dropping frame
+                    self.state = self.ID
+                    continue
+                self.state = self.EOF
+                self.sink.send((buf[0], pld))
+            elif state == self.ID:
+                id = data[i]
+                i += 1
+                if id >= 64: # not handling transport frames
+                    continue
+                buf.clear()
+                buf.append(id)
+                self.state = self.LEN
+            elif state == self.LEN:
+                buf.append(data[i])
+                self.need = data[i] + 4
+                i += 1
+                self.state = self.BODY
+            else:
+                # expected EOF==STF, but don't care
+                i += 1
+                self.state = self.ID
+
+
+# keep the pure python codec available, e.g. for conformance checks
+PyDecoder = Decoder
+pyPackFrame = packFrame
+
+try:
+    # compiled codec, built from _cmin.pyx if cython is available
+    from ._cmin import Decoder, packFrame
+    codecBackend = 'cython'
+except ImportError:
+    codecBackend = 'python'
@@ -15,6 +15,8 @@ _default = {
     "path": [
         ("export_dir", os.path.curdir),
         ("export_ext", ".csv"),
+        ("measurement_dir", ""),
+        ("capture_dir", os.path.curdir),
     ],
     "plot_colors": [
         ("blue", "#1f77b4"),
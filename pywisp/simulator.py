@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+This module contains a simulated test rig for load tests without hardware.
+
+The simulator serves a single host via udp, tcp or a pseudo terminal. Once the
+host sends the start command (frame id 1, payload 1) it streams frames of the
+configured number of channels at the configured rate, the stop command
+(payload 0) ends that. Each frame holds the time in ms since the start as
+uint32 followed by one float64 per channel. If a heartbeat timeout is set and
+the host's heartbeat (payload bit 1) is missed, the simulator stops and sends
+frame id 1 to the host, like a real rig does.
+"""
+
+import logging
+import os
+import select
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+from .connection import RecordSplitter, SerialConnection, TcpConnection, UdpConnection
+from .min import Decoder, packFrame
+from .utils import coroutine, pipe
+
+__all__ = ["RigSimulator", "SimUdpConnection", "SimTcpConnection", "SimSerialConnection"]
+
+
+class RigSimulator(object):
+    """
+    Test rig stand-in running in a background thread
+
+    The udp and serial transports use min framing, tcp uses the fixed size
+    records of :py:class:`~pywisp.connection.TcpConnection`. The serial
+    transport is a pseudo terminal and only available on posix systems.
+    """
+
+    def __init__(self, transport='udp', channels=4, rate=1000, frameId=15, maxPayload=80,
+                 heartbeatTimeout=0, maxBatch=100):
+        """
+        :param transport: one of 'udp', 'tcp' or 'serial'
+        :param channels: number of float64 values per frame
+        :param rate: frames per second
+        :param frameId: id of the data frames
+        :param maxPayload: payload size of the tcp records
+        :param heartbeatTimeout: seconds without heartbeat until the rig stops, 0 disables it
+        :param maxBatch: most frames sent in a single write, udp datagrams are
+            additionally limited to the host's receive size
+        """
+        if transport not in ('udp', 'tcp', 'serial'):
+            raise ValueError(f"unknown transport {transport}")
+        self.record = np.dtype([('time', '<u4'), ('values', '<f8', (channels,))])
+        limit = maxPayload if transport == 'tcp' else 255
+        if self.record.itemsize > limit:
+            raise ValueError(f"{channels} channels do not fit into a frame")
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.transport = transport
+        self.channels = channels
+        self.rate = rate
+        self.frameId = frameId
+        self.maxPayload = maxPayload
+        self.heartbeatTimeout = heartbeatTimeout
+        self.maxBatch = maxBatch
+        # frequency of each channel's sine
+        self.freqs = 0.5 * np.arange(1, channels + 1)
+
+        self.running = False
+        self.sent = 0
+        self.received = []
+        self._stop = False
+        self._thread = None
+        self._host = None
+        self._fds = []
+
+    def start(self):
+        """
+        Opens the transport and starts the simulation thread
+        :return: port for udp and tcp, device path for serial
+        """
+        if self.transport == 'udp':
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._sock.bind(('127.0.0.1', 0))
+            address = self._sock.getsockname()[1]
+        elif self.transport == 'tcp':
+            self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._server.bind(('127.0.0.1', 0))
+            self._server.listen(1)
+            address = self._server.getsockname()[1]
+        else:
+            master, slave = os.openpty()
+            self._fds = [master, slave]
+            address = os.ttyname(slave)
+
+        if self.transport == 'tcp':
+            rx = lambda sink: RecordSplitter(sink, self.maxPayload + 1)
+        else:
+            rx = Decoder
+        self._rx = pipe([rx, self._handler])
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return address
+
+    def stop(self):
+        """
+        Stops the simulation thread and closes the transport
+        """
+        self._stop = True
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.transport == 'udp':
+            self._sock.close()
+        elif self.transport == 'tcp':
+            if self._host is not None:
+                self._host.close()
+            self._server.close()
+        for fd in self._fds:
+            os.close(fd)
+        self._fds = []
+        self._host = None
+        self.running = False
+
+    @coroutine
+    def _handler(self):
+        """
+        handle the frames of the host. coroutine.
+        """
+        while True:
+            id, payload = yield
+            payload = bytes(payload)
+            if id != 1:
+                self.received.append((id, payload))
+                continue
+            if not payload:
+                self._logger.warning("ignoring command without payload")
+                continue
+            if payload[0] & 2:
+                self._lastBeat = time.monotonic()
+            elif payload[0] & 1:
+                self.running = True
+                self._startTime = self._lastBeat = time.monotonic()
+                self.sent = 0
+            else:
+                self.running = False
+
+    def _read(self, timeout):
+        """ pass the data of the host to the decoder, waits at most timeout seconds """
+        if self.transport == 'udp':
+            if select.select([self._sock], [], [], timeout)[0]:
+                data, self._host = self._sock.recvfrom(65536)
+                self._rx.send(data)
+        elif self.transport == 'tcp':
+            if self._host is None:
+                if select.select([self._server], [], [], timeout)[0]:
+                    self._host, _ = self._server.accept()
+                return
+            if select.select([self._host], [], [], timeout)[0]:
+                data = self._host.recv(65536)
+                if not data:
+                    # host closed the connection, wait for the next one
+                    self._host.close()
+                    self._host = None
+                    self.running = False
+                    return
+                self._rx.send(data)
+        else:
+            if select.select([self._fds[0]], [], [], timeout)[0]:
+                self._rx.send(os.read(self._fds[0], 65536))
+
+    def _write(self, frames):
+        """ send a list of (id, payload) frames to the host in one write """
+        if self.transport == 'tcp':
+            data = b''.join(bytes([id]) + payload + bytes(self.maxPayload - len(payload))
+                            for id, payload in frames)
+            self._host.sendall(data)
+        elif self.transport == 'udp':
+            # the host reads at most recvSize bytes per datagram, more is lost
+            datagram = b''
+            for id, payload in frames:
+                frame = packFrame(id, payload)
+                if len(datagram) + len(frame) > UdpConnection.recvSize:
+                    self._sock.sendto(datagram, self._host)
+                    datagram = b''
+                datagram += frame
+            self._sock.sendto(datagram, self._host)
+        else:
+            os.write(self._fds[0], b''.join(packFrame(id, payload) for id, payload in frames))
+
+    def _frames(self, start, stop):
+        """ pack the data frames with the indices start to stop """
+        n = np.arange(start, stop)
+        t = n / self.rate
+        records = np.empty(len(n), self.record)
+        records['time'] = (t * 1000).astype(np.uint32)
+        records['values'] = np.sin(2 * np.pi * np.outer(t, self.freqs))
+        data = records.tobytes()
+        size = self.record.itemsize
+        return [(self.frameId, data[i:i + size]) for i in range(0, len(data), size)]
+
+    def _run(self):
+        period = min(1 / self.rate, 0.01)
+        while not self._stop:
+            try:
+                self._read(period)
+                if not self.running or self._host is None and self.transport != 'serial':
+                    continue
+                now = time.monotonic()
+                if self.heartbeatTimeout and now - self._lastBeat > self.heartbeatTimeout:
+                    self._logger.warning("host missed heartbeat, stopping")
+                    self.running = False
+                    self._write([(1, bytes([0]))])
+                    continue
+                due = int((now - self._startTime) * self.rate)
+                while self.sent < due:
+                    stop = min(due, self.sent + self.maxBatch)
+                    self._write(self._frames(self.sent, stop))
+                    self.sent = stop
+            except OSError as e:
+                if not self._stop:
+                    self._logger.error(f"simulator failed: {e}")
+                break
+
+
+class SimUdpConnection(UdpConnection):
+    """
+    Udp connection to a :py:class:`RigSimulator`, which is started on connect
+    """
+
+    def __init__(self, **kwargs):
+        """
+        :param kwargs: arguments of :py:class:`RigSimulator`
+        """
+        self.simulator = RigSimulator('udp', **kwargs)
+        super().__init__('127.0.0.1', 0)
+
+    def _connect(self):
+        self.port = self.simulator.start()
+        if super()._connect():
+            return True
+        self.simulator.stop()
+        return False
+
+    def _disconnect(self):
+        super()._disconnect()
+        self.simulator.stop()
+
+
+class SimTcpConnection(TcpConnection):
+    """
+    Tcp connection to a :py:class:`RigSimulator`, which is started on connect
+    """
+
+    def __init__(self, maxPayload=80, **kwargs):
+        """
+        :param maxPayload: payload size of the records
+        :param kwargs: arguments of :py:class:`RigSimulator`
+        """
+        self.simulator = RigSimulator('tcp', maxPayload=maxPayload, **kwargs)
+        super().__init__('127.0.0.1', 0, maxPayload=maxPayload)
+
+    def _connect(self):
+        self.port = self.simulator.start()
+        if super()._connect():
+            return True
+        self.simulator.stop()
+        return False
+
+    def _disconnect(self):
+        super()._disconnect()
+        self.simulator.stop()
+
+
+class SimSerialConnection(SerialConnection):
+    """
+    Serial connection to a :py:class:`RigSimulator` behind a pseudo terminal,
+    which is started on connect. Only available on posix systems.
+    """
+
+    def __init__(self, baud=115200, **kwargs):
+        """
+        :param baud: baud rate, has no effect on the pseudo terminal
+        :param kwargs: arguments of :py:class:`RigSimulator`
+        """
+        self.simulator = RigSimulator('serial', **kwargs)
+        super().__init__('', baud)
+
+    def _connect(self):
+        self.serial.port = self.simulator.start()
+        if super()._connect():
+            return True
+        self.simulator.stop()
+        return False
+
+    def _disconnect(self):
+        super()._disconnect()
+        self.simulator.stop()
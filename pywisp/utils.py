@@ -1,15 +1,22 @@
 # -*- coding: utf-8 -*-
+import json
 import logging
+import math
+import multiprocessing
 import os
 import struct
+import shutil
+import tempfile
+import time
+import zipfile
 from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import subprocess
 from pathlib import Path
 import importlib.util
+from itertools import count
 
-import matplotlib
-import matplotlib.gridspec as gridspec
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 from PyQt5.QtCore import Qt, QObject, QRegExp, QSize, pyqtSignal, pyqtSlot, QRect, QThread
@@ -17,11 +24,13 @@ from PyQt5.QtGui import QColor, QIntValidator, QRegExpValidator, QIcon, QDoubleV
     QPainter, QTextCursor
 from PyQt5.QtWidgets import QVBoxLayout, QDialogButtonBox, QAction, QDialog, QLineEdit, QLabel, QHBoxLayout, QFormLayout, \
     QLayout, QComboBox, QPushButton, QWidget, QSlider, QMenu, QWidgetAction, QShortcut, QStyledItemDelegate, QStyle
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 from pyqtgraph.dockarea import Dock
 
 from .widgets.fileselector import FileSelector
 
-__all__ = ["createDir", "getResource", "packArrayToFrame", "coroutine", "pipe"]
+__all__ = ["createDir", "getResource", "packArrayToFrame", "iterArrayToFrames", "coroutine", "pipe"]
 
 
 def flatten(lst):
@@ -114,36 +123,85 @@ def getFormatedStructString(dataLenFloat, dataLenInt, lenFloat):
     return fmtStr
 
 
-def packArrayToFrame(id, data, frameLen, dataLenFloat, dataLenInt):
+def iterArrayToFrames(id, data, frameLen, dataLenFloat, dataLenInt):
     """
-    Packs data to an array of dataPoints with given identifier.
+    Packs data to dataPoints with given identifier, the frames are generated
+    lazily. The first frame starts with the length of data.
 
     :param id: identifier of frame
     :param data: data of frame
     :param frameLen: maximal data size of frame
     :param dataLenFloat: length of float datatype
     :param dataLenInt: length of integer datatype
-    :return: array of dataPoints (id + payload)
+    :return: generator of dataPoints (id + payload)
     """
-    completeData = len(data) * dataLenFloat + 1 * dataLenInt
-    N = np.ceil(completeData / frameLen)
+    data = np.asarray(data, dtype=np.float64)
+    n = len(data)
+    N = int(np.ceil((n * dataLenFloat + dataLenInt) / frameLen))
     frameLenFloat = frameLen // dataLenFloat
-    dataPoints = []
-    for i in range(int(N)):
+    # convert all values at once, frames are slices of the raw bytes
+    dtype = np.dtype('<f8' if dataLenFloat == 8 else '<f4')
+    raw = data.astype(dtype).tobytes()
+    size = dtype.itemsize
+
+    for i in range(N):
         if i > 0:
-            outList = [float(data[i * frameLenFloat + j - 1]) for j in range(frameLenFloat) if
-                       i * frameLenFloat + j - 1 < len(data)]
-            fmtStr = getFormatedStructString(dataLenFloat, 0, len(outList))
-            payload = struct.pack(fmtStr, *outList)
+            start = i * frameLenFloat - 1
+            end = min(start + frameLenFloat, n)
+            payload = raw[start * size:end * size] if frameLenFloat and start < n else b''
         else:
-            outList = [len(data)]
-            outList += [float(data[i * frameLenFloat + j]) for j in range(frameLenFloat - 1) if
-                        i * frameLenFloat + j < len(data)]
-            fmtStr = getFormatedStructString(dataLenFloat, dataLenInt, len(outList) - 1)
-            payload = struct.pack(fmtStr, *outList)
-        dataPoints += [{'id': id,
-                        'msg': payload}]
-    return dataPoints
+            header = struct.pack(getFormatedStructString(dataLenFloat, dataLenInt, 0), n)
+            payload = header + raw[:max(0, min(frameLenFloat - 1, n)) * size]
+        yield {'id': id,
+               'msg': payload}
+
+
+def packArrayToFrame(id, data, frameLen, dataLenFloat, dataLenInt):
+    """
+    Packs data to an array of dataPoints with given identifier.
+
+    :param id: identifier of frame
+    :param data: data of frame
+    :param frameLen: maximal data size of frame
+    :param dataLenFloat: length of float datatype
+    :param dataLenInt: length of integer datatype
+    :return: array of dataPoints (id + payload)
+    """
+    return list(iterArrayToFrames(id, data, frameLen, dataLenFloat, dataLenInt))
+
+
+class RefreshScheduler(object):
+    """
+    Adapts the refresh interval of the plots to the time needed for drawing
+
+    The interval is chosen, so that drawing takes at most the fraction `load`
+    of it. It is doubled while a backlog of more than `tolerance` received
+    frames grows and only slowly decreases again. Intervals are given in ms.
+    """
+
+    def __init__(self, minTime, maxTime, load=0.25, tolerance=100):
+        self.minTime = minTime
+        self.maxTime = max(minTime, maxTime)
+        self.load = load
+        self.tolerance = tolerance
+        self.interval = minTime
+        self._backlog = 0
+
+    def update(self, duration, backlog=0):
+        """
+        Computes the next refresh interval
+        :param duration: time in ms needed by the last refresh
+        :param backlog: number of received frames not yet handled
+        :return: the new interval in ms
+        """
+        target = duration / self.load
+        if backlog > max(self._backlog, self.tolerance):
+            target = max(target, 2 * self.interval)
+        self._backlog = backlog
+        if target < self.interval:
+            target = 0.8 * self.interval + 0.2 * target
+        self.interval = min(max(target, self.minTime), self.maxTime)
+        return int(self.interval)
 
 
 class PlainTextLogger(logging.Handler):
@@ -178,24 +236,290 @@ class PlainTextLogger(logging.Handler):
             logging.getLogger().error("No callback configured!")
 
 
+# source of generation numbers, unique over all buffers
+_generations = count(1)
+
+
+def retainedStart(time, maxSize=0, maxTime=0):
+    """
+    Returns the index of the first sample to keep under the given retention limits
+    :param time: time(stamps) of the stored samples, ascending
+    :param maxSize: number of samples to keep, 0 for no limit
+    :param maxTime: time span in s to keep, 0 for no limit
+    :return: index of the first retained sample
+    """
+    start = 0
+    if maxSize:
+        start = max(0, len(time) - int(maxSize))
+    if maxTime and len(time):
+        start = max(start, int(np.searchsorted(time, time[-1] - maxTime)))
+    return start
+
+
+class SpillFile(object):
+    """
+    Append only file, that takes the samples a buffer drops under its
+    retention limits, see :py:class:`DataPointBuffer`. The samples are stored
+    as raw records of time and value and can be read back memory mapped.
+    """
+
+    def __init__(self, path, dtype=np.float64):
+        self.path = path
+        self.dtype = np.dtype([('time', np.float64), ('value', dtype)])
+        self._file = open(path, 'wb')
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def write(self, time, values):
+        """
+        Appends samples to the file
+        :param time: time(stamps) of the samples
+        :param values: values of the samples
+        """
+        rows = np.empty(len(time), dtype=self.dtype)
+        rows['time'] = time
+        rows['value'] = values
+        self._file.write(rows.tobytes())
+        self._len += len(rows)
+
+    def read(self):
+        """
+        Returns the samples written so far, memory mapped copy-on-write
+        :return: tuple of time(stamps) and values
+        """
+        if not self._len:
+            rows = np.empty(0, dtype=self.dtype)
+        else:
+            if not self._file.closed:
+                self._file.flush()
+            rows = np.memmap(self.path, dtype=self.dtype, mode='c', shape=(self._len,))
+        return rows['time'], rows['value']
+
+    def clear(self):
+        """ drops all written samples """
+        self._file.seek(0)
+        self._file.truncate()
+        self._len = 0
+
+    def close(self):
+        """ closes the file, the written samples can still be read """
+        self._file.close()
+
+
+class SampleTable(object):
+    """
+    Record table for frames, that carry several data points with one timestamp
+
+    The rows are stored in a structured numpy array with one time column and
+    one value column per data point, whose capacity is doubled when full.
+    :py:class:`DataPointBuffer` objects bound to the table are views onto
+    the columns. The retention limits, :py:attr:`generation` and
+    :py:attr:`series` work like the ones of :py:class:`DataPointBuffer`,
+    dropped values are written to the spill files of the data points given
+    in spills.
+    """
+
+    def __init__(self, names, dtype=np.float64, capacity=1024, maxSize=0, maxTime=0, spills=None):
+        self.maxSize = maxSize
+        self.maxTime = maxTime
+        self.spills = spills or {}
+        self.names = tuple(names)
+        self.fields = {name: 'v{}'.format(i) for i, name in enumerate(self.names)}
+        self._data = np.empty(capacity, dtype=[('time', np.float64)]
+                              + [(self.fields[name], dtype) for name in self.names])
+        self._len = 0
+        self.generation = next(_generations)
+        self.series = self.generation
+
+    def __len__(self):
+        return self._len
+
+    @property
+    def time(self):
+        """ time(stamps) of the stored rows """
+        return self._data['time'][:self._len]
+
+    def column(self, name):
+        """
+        Returns the stored values of one data point
+        :param name: name of the data point
+        """
+        return self._data[self.fields[name]][:self._len]
+
+    def addRow(self, time, values):
+        """
+        Adds a new row to the table
+        :param time: time(stamp) of the row
+        :param values: values of all data points, ordered like :py:attr:`names`
+        """
+        if self._len == len(self._data):
+            self._makeRoom()
+        self._data[self._len] = (time, *values)
+        self._len += 1
+        self.generation = next(_generations)
+
+    def _makeRoom(self):
+        """ drops the rows outside the retention limits or grows the table """
+        n = self._len
+        capacity = len(self._data)
+        start = retainedStart(self._data['time'][:n], self.maxSize, self.maxTime)
+        for name, spill in self.spills.items():
+            if spill is not None and start:
+                spill.write(self._data['time'][:start], self._data[self.fields[name]][:start])
+        keep = n - start
+        if keep + 1 <= capacity // 2:
+            self._data[:keep] = self._data[start:n]
+        else:
+            new = np.empty(max(2 * capacity, keep + 1), dtype=self._data.dtype)
+            new[:keep] = self._data[start:n]
+            self._data = new
+        self._len = keep
+        if start:
+            self.series = next(_generations)
+
+
 class DataPointBuffer(object):
     """
     Buffer object to store the values of the data points
+
+    time and values are kept in preallocated numpy arrays, whose capacity is
+    doubled when full. :py:attr:`time` and :py:attr:`values` are views onto
+    the filled part of these arrays, they are not copied.
+
+    With maxSize or maxTime set, only the last maxSize samples or the
+    samples of the last maxTime seconds are retained. Older samples are
+    dropped whenever the arrays are full, by moving the retained ones to
+    the front, so the memory stays bounded and the views stay contiguous.
+    With a :py:class:`SpillFile` given as spill, the dropped samples are
+    written to it, :py:func:`saveDataPoints` joins them with the retained
+    ones again.
+
+    A buffer can also be bound to a column of a :py:class:`SampleTable`, then
+    it only refers to the data stored there.
+
+    Every change of the stored data assigns a new :py:attr:`generation`, so
+    consumers can tell whether a buffer changed since they last looked at it.
+    :py:attr:`series` only changes if samples are dropped or replaced, so it
+    stays the same while samples are appended.
     """
 
-    def __init__(self, time=None, values=None):
-        if time is None:
-            self.time = []
-        elif isinstance(time, list):
-            self.time = time
-        elif isinstance(time, np.ndarray):
-            self.time = time.tolist()
-        if values is None:
-            self.values = []
-        elif isinstance(values, list):
-            self.values = values
-        elif isinstance(values, np.ndarray):
-            self.values = values.tolist()
+    def __init__(self, time=None, values=None, dtype=np.float64, capacity=1024, maxSize=0, maxTime=0,
+                 spill=None):
+        self.maxSize = maxSize
+        self.maxTime = maxTime
+        self.spill = spill
+        self._table = None
+        self._time = np.empty(capacity, dtype=np.float64)
+        self._values = np.empty(capacity, dtype=dtype)
+        self._len = 0
+        self._generation = next(_generations)
+        self._series = self._generation
+        if time is not None:
+            if values is None:
+                # accepted like before, the times are stored without values
+                values = np.full(len(time), np.nan if self._values.dtype.kind in 'fc' else 0, dtype=dtype)
+            self.extend(time, values)
+
+    @property
+    def table(self):
+        """ sample table the buffer is bound to, or None """
+        return self._table
+
+    @property
+    def generation(self):
+        """ number identifying the current state of the stored data """
+        if self._table is not None:
+            return self._table.generation
+        return self._generation
+
+    @property
+    def series(self):
+        """ number identifying the stored series, kept while samples are appended """
+        if self._table is not None:
+            return self._table.series
+        return self._series
+
+    @property
+    def time(self):
+        """ time(stamps) of the stored values """
+        if self._table is not None:
+            return self._table.time
+        return self._time[:self._len]
+
+    @property
+    def values(self):
+        """ stored values """
+        if self._table is not None:
+            return self._table.column(self._name)
+        return self._values[:self._len]
+
+    def __len__(self):
+        if self._table is not None:
+            return len(self._table)
+        return self._len
+
+    def bind(self, table, name):
+        """
+        Turns the buffer into a view onto a column of a sample table, values
+        stored so far are dropped
+        :param table: the sample table
+        :param name: name of the data point within the table
+        """
+        self.__init__(dtype=self._values.dtype, capacity=0,
+                      maxSize=self.maxSize, maxTime=self.maxTime, spill=self.spill)
+        self._table = table
+        self._name = name
+
+    def _unbind(self):
+        """ copies the data of the bound column into the own arrays """
+        table, self._table = self._table, None
+        values = table.column(self._name)
+        self.__init__(dtype=values.dtype, capacity=len(values),
+                      maxSize=table.maxSize, maxTime=table.maxTime, spill=self.spill)
+        self.extend(table.time, values)
+
+    @classmethod
+    def fromArrays(cls, time, values):
+        """
+        Creates a buffer using the given arrays as storage, without copying them
+        :param time: array of time(stamps)
+        :param values: array of values
+        :return: the buffer
+        """
+        buf = cls(dtype=values.dtype, capacity=0)
+        buf._time, buf._values, buf._len = time, values, len(time)
+        buf._generation = buf._series = next(_generations)
+        return buf
+
+    def _makeRoom(self, size):
+        """
+        Makes room for size more values, drops the values outside the
+        retention limits or grows the arrays
+        :param size: number of values to add
+        """
+        n = self._len
+        capacity = len(self._time)
+        if n + size <= capacity:
+            return
+        start = retainedStart(self._time[:n], self.maxSize, self.maxTime)
+        if self.spill is not None and start:
+            self.spill.write(self._time[:start], self._values[:start])
+        keep = n - start
+        if keep + size <= capacity // 2:
+            self._time[:keep] = self._time[start:n]
+            self._values[:keep] = self._values[start:n]
+        else:
+            capacity = max(2 * capacity, keep + size)
+            for attr in ('_time', '_values'):
+                old = getattr(self, attr)
+                new = np.empty(capacity, dtype=old.dtype)
+                new[:keep] = old[start:n]
+                setattr(self, attr, new)
+        self._len = keep
+        if start:
+            self._series = next(_generations)
 
     def addValue(self, time, value):
         """
@@ -204,37 +528,318 @@ class DataPointBuffer(object):
         :param value: the new value for the data point (y axis)
         :return:
         """
-        self.time.append(time)
-        self.values.append(value)
+        if self._table is not None:
+            self._unbind()
+        if self._len == len(self._time):
+            self._makeRoom(1)
+        n = self._len
+        self._time[n] = time
+        self._values[n] = value
+        self._len = n + 1
+        self._generation = next(_generations)
+
+    def extend(self, time, values):
+        """
+        Adds several values to the data point buffer
+        :param time: time(stamps) of the corresponding values (x axis)
+        :param values: the new values for the data point (y axis)
+        """
+        if self._table is not None:
+            self._unbind()
+        n = len(time)
+        self._makeRoom(n)
+        self._time[self._len:self._len + n] = time
+        self._values[self._len:self._len + n] = values
+        self._len += n
+        self._generation = next(_generations)
 
     def clearBuffer(self):
         """
         Clears all the buffers of the data point
         """
-        del self.values[:]
-        del self.time[:]
+        self._table = None
+        self._len = 0
+        if self.spill is not None:
+            self.spill.clear()
+        self._generation = self._series = next(_generations)
+
+    def __getstate__(self):
+        # only store the filled part
+        return {'time': self.time, 'values': self.values}
+
+    def __setstate__(self, state):
+        values = np.asarray(state['values'])
+        self.__init__(dtype=values.dtype if len(values) else np.float64,
+                      capacity=len(values))
+        self.extend(state['time'], values)
+
+
+def _saveArray(path, head, tail):
+    """ writes the concatenation of two arrays to a .npy file, without joining them in memory """
+    if not len(head):
+        np.save(path, tail)
+        return
+    out = np.lib.format.open_memmap(path, mode='w+', dtype=tail.dtype, shape=(len(head) + len(tail),))
+    out[:len(head)] = head
+    out[len(head):] = tail
+    out.flush()
+    del out
+
+
+def saveDataPoints(dataPointBuffers, path):
+    """
+    Writes data point buffers as a set of .npy files to a directory. Data
+    points bound to the same sample table share one time file. Samples
+    dropped to the spill file of a buffer are written in front of the
+    retained ones.
+    :param dataPointBuffers: dict of data point buffers
+    :param path: directory to write to, is created if missing
+    """
+    os.makedirs(path, exist_ok=True)
+    index = {}
+    timeFiles = {}
+    for i, (name, buf) in enumerate(dataPointBuffers.items()):
+        spilled = buf.spill.read() if buf.spill is not None else ((), ())
+        key = id(buf.table) if buf.table is not None and not len(spilled[0]) else name
+        if key not in timeFiles:
+            timeFiles[key] = 'time{}.npy'.format(len(timeFiles))
+            _saveArray(os.path.join(path, timeFiles[key]), spilled[0], buf.time)
+        valueFile = 'values{}.npy'.format(i)
+        _saveArray(os.path.join(path, valueFile), spilled[1], buf.values)
+        index[name] = [timeFiles[key], valueFile]
+    with open(os.path.join(path, 'index.json'), 'w') as f:
+        json.dump(index, f)
+
+
+def loadDataPoints(path):
+    """
+    Opens data point buffers written by :py:func:`saveDataPoints`. The data is
+    memory mapped copy-on-write, so it is only read from disk when accessed and
+    changes are never written back.
+    :param path: directory of the stored data points
+    :return: dict of data point buffers
+    """
+    with open(os.path.join(path, 'index.json')) as f:
+        index = json.load(f)
+    arrays = {}
+
+    def load(fileName):
+        if fileName not in arrays:
+            arrays[fileName] = np.load(os.path.join(path, fileName), mmap_mode='c')
+        return arrays[fileName]
+
+    return {name: DataPointBuffer.fromArrays(load(timeFile), load(valueFile))
+            for name, (timeFile, valueFile) in index.items()}
+
+
+class StoreThread(QThread):
+    """
+    Stores data point buffers on disk in the background and reopens them
+    memory mapped, see :py:func:`saveDataPoints`. The buffers must not be
+    changed while the thread is running. The files are written to a new
+    directory in `baseDir`, which is available as :py:attr:`path` once the
+    buffers are stored.
+    """
+    stored = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, dataPointBuffers, baseDir):
+        super().__init__()
+        self.dataPointBuffers = dataPointBuffers
+        self.baseDir = baseDir
+        self.path = None
+
+    def run(self):
+        path = None
+        try:
+            path = tempfile.mkdtemp(prefix=time.strftime("%Y%m%d-%H%M%S-"), dir=self.baseDir)
+            saveDataPoints(self.dataPointBuffers, path)
+            self.path = path
+            self.stored.emit(loadDataPoints(path))
+        except OSError as e:
+            if path is not None:
+                shutil.rmtree(path, ignore_errors=True)
+            self.failed.emit(str(e))
+
+
+class DecimationPyramid(object):
+    """
+    Incrementally built peak and mean decimation levels of one curve
+
+    Level k combines blocks of 2**k samples, each level is computed from the
+    one below and only extended by the blocks completed since the last update.
+    The peak level stores maximum and minimum of each block interleaved, the
+    mean level the block average, both at the time of the block's centre sample.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.levels = []
+        self.series = None
+        self.size = 0
+
+    def update(self, x, y, depth=None, series=None):
+        """
+        Extends the levels by the new samples. The levels are rebuilt, if the
+        data does not continue the one seen so far.
+        :param x: time of all samples
+        :param y: values of all samples
+        :param depth: number of levels to extend, all by default
+        :param series: :py:attr:`DataPointBuffer.series` of the data, without
+            it the data is taken to continue while its first time is the same
+        """
+        if not len(x):
+            self.reset()
+            return
+        if series is None:
+            series = x[0]
+        if series != self.series or len(x) < self.size:
+            self.reset()
+            self.series = series
+        self.size = len(x)
+
+        k = 1
+        while len(x) >> k and (depth is None or k <= depth):
+            b = 1 << k
+            blocks = len(x) >> k
+            if len(self.levels) < k:
+                self.levels.append((DataPointBuffer(), DataPointBuffer()))
+            peak, mean = self.levels[k - 1]
+            done = len(mean)
+            if blocks == done:
+                # no new blocks on the higher levels either
+                break
+            if k == 1:
+                y0, y1 = y[2 * done:2 * blocks:2], y[2 * done + 1:2 * blocks:2]
+                hi, lo = np.maximum(y0, y1), np.minimum(y0, y1)
+            else:
+                lowerPeak, lowerMean = self.levels[k - 2]
+                pv = lowerPeak.values[4 * done:4 * blocks]
+                hi, lo = np.maximum(pv[0::4], pv[2::4]), np.minimum(pv[1::4], pv[3::4])
+                lm = lowerMean.values[2 * done:2 * blocks]
+                y0, y1 = lm[0::2], lm[1::2]
+            pv = np.empty(2 * (blocks - done))
+            pv[0::2] = hi
+            pv[1::2] = lo
+            xs = x[done * b + b // 2:blocks * b:b]
+            mean.extend(xs, (y0 + y1) * 0.5)
+            peak.extend(np.repeat(xs, 2), pv)
+            k += 1
+
+    def sample(self, ds, method, x, y, series=None):
+        """
+        Returns the curve decimated by the largest power of two not above ds,
+        the levels needed for that are extended first
+        :param ds: sample step
+        :param method: one of 'peak', 'mean' or 'subsample', data is not
+            decimated otherwise
+        :param x: time of all samples
+        :param y: values of all samples
+        :param series: see :py:meth:`update`
+        :return: x and y of the decimated curve
+        """
+        if ds <= 1 or method not in ('peak', 'mean', 'subsample'):
+            return x, y
+        k = int(math.log2(ds))
+        if method == 'subsample':
+            return x[::1 << k], y[::1 << k]
+        self.update(x, y, k, series)
+        k = min(k, len(self.levels))
+        if k == 0:
+            return x, y
+        peak, mean = self.levels[k - 1]
+        buf = peak if method == 'peak' else mean
+        return buf.time, buf.values
+
+
+def groupByTime(dataPoints):
+    """
+    Groups data points with identical time(stamps), e.g. the ones bound to
+    the same sample table.
+    :param dataPoints: dict of data point buffers
+    :return: list of (time, names) tuples in order of first appearance
+    """
+    groups = []
+    for name, buf in dataPoints.items():
+        time = buf.time
+        for t, names in groups:
+            if len(t) == len(time) and (t.ctypes.data == time.ctypes.data or np.array_equal(t, time)):
+                names.append(name)
+                break
+        else:
+            groups.append((time, [name]))
+    return groups
+
+
+def mergeChunks(dataPoints, groups, chunkSize=100000):
+    """
+    Merges the groups of data points on their common time axis chunk by
+    chunk, so only one chunk is held in memory at a time. Equal times of
+    different groups are merged into one row, missing values are NaN.
+    :param dataPoints: dict of data point buffers, defines the column order
+    :param groups: groups of data points with sorted time, see :py:func:`groupByTime`
+    :param chunkSize: number of samples taken from each group at most per chunk
+    :return: generator of (time, block) tuples, block has a column per data point
+    """
+    columns = {name: col for col, name in enumerate(dataPoints)}
+    pos = [0] * len(groups)
+    while any(p < len(t) for (t, _), p in zip(groups, pos)):
+        # the chunk ends with the earliest time any group reaches within chunkSize
+        ends = [t[p + chunkSize - 1] for (t, _), p in zip(groups, pos) if p + chunkSize <= len(t)]
+        stops = [np.searchsorted(t, min(ends), 'right') if ends else len(t) for t, _ in groups]
+        if len(groups) == 1:
+            time = groups[0][0][pos[0]:stops[0]]
+        else:
+            time = np.unique(np.concatenate([t[p:s] for (t, _), p, s in zip(groups, pos, stops)]))
+        block = np.full((len(time), len(columns)), np.nan)
+        for (t, names), p, s in zip(groups, pos, stops):
+            rows = np.searchsorted(time, t[p:s])
+            for name in names:
+                block[rows, columns[name]] = dataPoints[name].values[p:s]
+        pos = stops
+        yield time, block
+
+
+def formatCsv(time, block, sep=','):
+    """
+    Formats a merged chunk as csv rows without header, see :py:func:`mergeChunks`.
+    Runs in the export processes, so it must stay a module level function.
+    """
+    return pd.DataFrame(block, index=time).to_csv(header=False, sep=sep)
 
 
 class Exporter(QObject):
     """
-    Class exports data points from GUI to different formats (csv, png) as pandas dataframe.
+    Class exports data points from GUI to different formats (csv, png, npz, parquet, feather).
+    Data points with identical time(stamps) are exported together, csv files are
+    written chunk by chunk and formatted by a pool of `processes` processes.
     """
     done = pyqtSignal(bool)
+    formats = ["CSV Data (*.csv)", "PNG Image (*.png)", "NumPy Archive (*.npz)",
+               "Parquet Data (*.parquet)", "Feather Data (*.feather)"]
 
     def __init__(self, **kwargs):
         super().__init__()
         dataPoints = kwargs.get("dataPoints", None)
-        fileName = kwargs.get("fileName", None) or FileSelector(
-            ["CSV Data (*.csv)", "PNG Image (*.png)"]
-        ).getSaveFileName()
+        fileName = kwargs.get("fileName", None) or FileSelector(self.formats).getSaveFileName()
 
-        self.worker = self.ExportThread(self, dataPoints, fileName)
+        self.worker = self.ExportThread(self, dataPoints, fileName,
+                                        kwargs.get("processes", None), kwargs.get("chunkSize", 100000))
         self.logger = logging.getLogger("Exporter")
-        def handleLog(done, lvl, msg):
-            self.logger.log(lvl, msg)
-            if done:
-                self.done.emit(lvl != logging.ERROR)
-        self.worker.info.connect(handleLog)
+        # a slot of this object, so Qt drops queued messages once it is deleted
+        self.worker.info.connect(self.handleLog)
+
+    def __del__(self):
+        # the running thread must not be destroyed along with the exporter
+        self.wait()
+
+    @pyqtSlot(bool, int, str)
+    def handleLog(self, done, lvl, msg):
+        self.logger.log(lvl, msg)
+        if done:
+            self.done.emit(lvl != logging.ERROR)
 
     def runExport(self):
         self.worker.start()
@@ -247,11 +852,14 @@ class Exporter(QObject):
 
     class ExportThread(QThread):
         info = pyqtSignal(bool,int,str)
-        def __init__(self, parent, data, file):
+        def __init__(self, parent, data, file, processes=None, chunkSize=100000):
             super().__init__()
             self.dataPoints = data
             self.fileName = file
             self.parent = parent
+            self.processes = processes or os.cpu_count() or 1
+            self.chunkSize = chunkSize
+            self.groups = None
 
         def run(self):
             if self.dataPoints is None:
@@ -261,61 +869,149 @@ class Exporter(QObject):
                 self.info.emit(True, logging.ERROR, f"Export failed: No file name given")
                 return
             self.info.emit(False, logging.INFO, f"Export to {self.fileName} started.")
-            self._buildFrame()
-            if self.df is None:
-                return
+            self.groups = groupByTime(self.dataPoints)
             file, ext = os.path.splitext(self.fileName)
-            if ext == '.csv':
-                self.exportCsv()
-            elif ext == '.png':
-                self.exportPng()
-            else:
+            exports = {'.csv': self.exportCsv,
+                       '.png': self.exportPng,
+                       '.npz': self.exportNpz,
+                       '.parquet': self.exportParquet,
+                       '.feather': self.exportFeather}
+            if ext not in exports:
                 self.info.emit(True, logging.ERROR, f"Export failed: Unsupported file extension '{ext}'.")
                 return
+            try:
+                exports[ext]()
+            except ImportError as e:
+                self.info.emit(True, logging.ERROR, f"Export failed: {ext} files need {e.name or e}")
+                return
+            except Exception as e:
+                self.info.emit(True, logging.ERROR, f"Export failed: {e}")
+                return
             self.info.emit(True, logging.INFO, f"Export successful.")
 
-        def _buildFrame(self):
-            # build pandas data frame
-            d = {key: pd.Series(val.values, index=val.time)
-                 for key, val in self.dataPoints.items()}
-            try:
-                self.df = pd.DataFrame.from_dict(d, orient='index').transpose()
-                self.df.index.name = 'time'
-                self.df.sort_index(inplace=True)
-            except BaseException:
-                self.parent.failed.emit()
-                self.df = None
-
-        def exportPng(self):
+        def _formatChunks(self, sep):
             """
-            Exports the data point dataframe as png with matplotlib.
-            :param fileName: name of file with extension
+            Yields the merged chunks formatted as csv in order. Small exports
+            are formatted in this thread, larger ones by a process pool, with
+            only a few chunks in flight.
             """
-
-            matplotlib.use('agg')
-            fig = plt.figure(figsize=(10, 6))
-            gs = gridspec.GridSpec(1, 1, hspace=0.1)
-            axes = plt.Subplot(fig, gs[0])
-
-            for col in self.df.columns:
-                self.df[col].plot(ax=axes, label=col)
+            chunks = mergeChunks(self.dataPoints, self.groups, self.chunkSize)
+            if self.processes == 1 or sum(len(t) for t, _ in self.groups) <= self.chunkSize:
+                for chunk in chunks:
+                    yield formatCsv(*chunk, sep)
+                return
+            # forked processes could inherit locks held by other threads, e.g. of qt
+            with ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('spawn')) as pool:
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(pool.submit(formatCsv, *chunk, sep))
+                    if len(pending) > 2 * self.processes:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+
+        def exportPng(self, dpi=300):
+            """
+            Exports the data points as png with matplotlib. Each curve is peak
+            decimated to about its minimum and maximum per pixel column first,
+            see :py:class:`DecimationPyramid`, and drawn as band between them.
+            The figure is rendered by the agg backend directly, without pyplot.
+            :param dpi: resolution of the image
+            """
+            fig = Figure(figsize=(10, 6))
+            FigureCanvasAgg(fig)
+            axes = fig.add_subplot(1, 1, 1)
+            columns = axes.get_position().width * fig.get_figwidth() * dpi
+
+            for name, buf in self.dataPoints.items():
+                time, values = buf.time, buf.values
+                x, y = DecimationPyramid().sample(len(time) / columns, 'peak', time, values)
+                if x is time:
+                    axes.plot(time, values, label=name)
+                    continue
+                # the band between the peaks looks like the zig-zag line through
+                # them, but renders a lot faster
+                line, = axes.plot([], [], label=name)
+                axes.fill_between(x[::2], y[1::2], y[::2], color=line.get_color(),
+                                  linewidth=line.get_linewidth())
 
             axes.legend(bbox_to_anchor=(0., 1.02, 1., .102), loc=4,
                         ncol=4, mode="expand", borderaxespad=0., framealpha=0.5)
 
             axes.grid(True)
-            if self.df.index.name == 'time':
-                axes.set_xlabel(r"Time (s)")
+            axes.set_xlabel(r"Time (s)")
 
-            fig.add_subplot(axes)
-            fig.savefig(self.fileName, dpi=300)
+            fig.savefig(self.fileName, dpi=dpi)
 
         def exportCsv(self, sep=','):
             """
-            Exports the data point dataframe as csv
+            Exports the data points as csv, chunk by chunk
             :param sep: separator for csv (default: ,)
             """
-            self.df.to_csv(self.fileName, sep=sep)
+            header = pd.DataFrame(columns=list(self.dataPoints), index=pd.Index([], name='time'))
+            with open(self.fileName, 'w', newline='') as f:
+                f.write(header.to_csv(sep=sep))
+                for text in self._formatChunks(sep):
+                    f.write(text)
+
+        def exportNpz(self):
+            """
+            Exports the data points as numpy archive, each data point is stored
+            with its values under its name and its time under `<name>_time`
+            """
+            # written like np.savez, which does not allow arbitrary names
+            with zipfile.ZipFile(self.fileName, 'w', allowZip64=True) as zf:
+                for name, buf in self.dataPoints.items():
+                    for key, array in [(name, buf.values), (name + '_time', buf.time)]:
+                        with zf.open(key + '.npy', 'w', force_zip64=True) as f:
+                            np.lib.format.write_array(f, np.asanyarray(array))
+
+        def _recordBatches(self):
+            """
+            Builds a record batch per group of data points sharing their time,
+            see :py:func:`groupByTime`. The columns are taken from the buffers,
+            the ones of the other groups are null in the batch.
+            :return: schema and generator of record batches
+            """
+            import pyarrow as pa
+            schema = pa.schema([('time', pa.float64())]
+                               + [(name, pa.from_numpy_dtype(buf.values.dtype))
+                                  for name, buf in self.dataPoints.items()])
+
+            def batches():
+                for time, names in self.groups:
+                    arrays = [pa.array(time, type=pa.float64())]
+                    for name, arrowType in zip(self.dataPoints, schema.types[1:]):
+                        if name in names:
+                            arrays.append(pa.array(self.dataPoints[name].values, type=arrowType))
+                        else:
+                            arrays.append(pa.nulls(len(time), arrowType))
+                    yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+            return schema, batches()
+
+        def exportParquet(self):
+            """
+            Exports the data points as parquet file with a row group per
+            time group, needs pyarrow
+            """
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            schema, batches = self._recordBatches()
+            with pq.ParquetWriter(self.fileName, schema) as writer:
+                for batch in batches:
+                    writer.write_table(pa.Table.from_batches([batch]))
+
+        def exportFeather(self):
+            """
+            Exports the data points as feather file with a record batch per
+            time group, needs pyarrow
+            """
+            import pyarrow as pa
+            schema, batches = self._recordBatches()
+            with pa.ipc.new_file(self.fileName, schema) as writer:
+                for batch in batches:
+                    writer.write_batch(batch)
 
 
 class DataIntDialog(QDialog):
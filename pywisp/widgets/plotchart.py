@@ -1,13 +1,13 @@
 import math
 import numpy as np
-from bisect import bisect_left
 from PyQt5.QtCore import QTimer, pyqtSignal
 from PyQt5.QtGui import QColor
 from PyQt5.QtWidgets import QAction, QMenu, QWidget
 from pyqtgraph import PlotWidget, TextItem, mkPen
-from pywisp.utils import ContextLineEditAction, DataPointBuffer, Exporter
+from pywisp.utils import ContextLineEditAction, DataPointBuffer, DecimationPyramid, Exporter
 from ..settings import Settings
 
+
 class PlotChart(PlotWidget):
     """
     Object containing the plot widgets and the associated plot curves
@@ -34,6 +34,10 @@ class PlotChart(PlotWidget):
             'downsamplingMethod': config.get("downsamplingMethod", 'peak')
         }
         self.cache = {}
+        # state of the data each curve shows, to skip unchanged ones
+        self.drawn = {}
+        # data to show, once the chart gets visible
+        self.pendingData = None
 
         coordItem = TextItem(text='', anchor=(0, 1))
         self.getPlotItem().addItem(coordItem, ignoreBounds=True)
@@ -106,6 +110,7 @@ class PlotChart(PlotWidget):
             curve = self.plotCurves.pop(name)
         if name in self.cache:
             del self.cache[name]
+        self.drawn.pop(name, None)
         self.getPlotItem().removeItem(curve)
         # update colors of remaining curves
         for ix, curve in enumerate(self.plotCurves.values()):
@@ -126,32 +131,47 @@ class PlotChart(PlotWidget):
     def getMovingWindowWidth(self):
         return self.movingWindowWidth
 
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.pendingData is not None:
+            self.updateCurves(self.pendingData)
+
     def updateCurves(self, dataPoints):
         """
-        Updates all curves of the plot with the actual data in the buffers
+        Updates all curves of the plot with the actual data in the buffers,
+        curves whose data did not change since the last update are skipped
         """
+        self.pendingData = None
         keys = [ name for name in self.plotCurves.keys()
                     if name in dataPoints ]
         lastX = [ dataPoints[name].time[-1]
                      for name in keys
-                     if dataPoints[name].time ]
+                     if len(dataPoints[name]) ]
         if not lastX:
             return
         firstX = max(lastX) - self.movingWindowWidth
-
-        def xRange(time, values):
-            start = bisect_left(time, firstX)
-            return time[start:], values[start:]
+        method = self.config['downsamplingMethod']
 
         for name in keys:
             datax = dataPoints[name].time
             datay = dataPoints[name].values
             if self.movingWindowEnable:
-                datax, datay = xRange(datax, datay)
-                ds = self._samplestep(datax)
-                x, y = self._downsample(ds, datax, datay)
+                start = np.searchsorted(datax, firstX)
+                ds = self._samplestep(datax[start:])
+                state = (dataPoints[name].generation, ds, firstX)
             else:
-                x, y = self._cachedsample(name, datax, datay)
+                ds = self._samplestep(datax)
+                state = (dataPoints[name].generation, ds)
+            if self.drawn.get(name) == state:
+                continue
+            self.drawn[name] = state
+            if name not in self.cache:
+                self.cache[name] = DecimationPyramid()
+            pyramid = self.cache[name]
+            x, y = pyramid.sample(ds, method, datax, datay, dataPoints[name].series)
+            if self.movingWindowEnable:
+                start = np.searchsorted(x, firstX)
+                x, y = x[start:], y[start:]
             self.plotCurves[name].setData(x, y)
 
 
@@ -171,7 +191,7 @@ class PlotChart(PlotWidget):
 
     def _samplestep(self, X):
         ds = 1
-        if not X:
+        if not len(X):
             return ds
         view = self.getViewBox()
         if view is None:
@@ -196,50 +216,3 @@ class PlotChart(PlotWidget):
                     if math.isfinite(ds_float):
                         ds = int(ds_float)
         return ds
-
-    def _downsample(self, ds, x, y):
-        if ds <= 1:
-            return x, y
-        if self.config['downsamplingMethod'] == 'subsample':
-            x = x[::ds]
-            y = y[::ds]
-        elif self.config['downsamplingMethod'] == 'mean':
-            n = len(x) // ds
-            # start of x-values try to select a somewhat centered point
-            stx = ds // 2
-            x = x[stx:stx + n * ds:ds]
-            y = np.array(y[:n * ds]).reshape(n, ds).mean(axis=1).tolist()
-        elif self.config['downsamplingMethod'] == 'peak':
-            n = len(x) // ds
-            x1 = np.empty((n, 2))
-            # start of x-values; try to select a somewhat centered point
-            stx = ds // 2
-            x1[:] = np.array(x)[stx:stx + n * ds:ds, np.newaxis]
-            x = x1.reshape(n * 2).tolist()
-            y1 = np.empty((n, 2))
-            y2 = np.array(y[:n * ds]).reshape((n, ds))
-            y1[:, 0] = y2.max(axis=1)
-            y1[:, 1] = y2.min(axis=1)
-            y = y1.reshape(n * 2).tolist()
-        else:
-            ...
-        return x, y
-
-    def _cachedsample(self, name, x, y):
-        ds = self._samplestep(x)
-        if name in self.cache:
-            cds, cx, cy = self.cache[name]
-            if ds == cds:
-                ## reuse cached data, append new
-                ix = bisect_left(x, cx[-1])
-                ex, ey = x[ix+1:], y[ix+1:]
-                assert( len(x) > ix )
-                if ex:
-                    ex, ey = self._downsample(ds, ex, ey)
-                cx.extend(ex)
-                cy.extend(ey)
-                return cx, cy
-        ## recalculate whole downsampling
-        x, y = self._downsample(ds, x, y)
-        self.cache[name] = (ds, x, y)
-        return x, y
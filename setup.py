@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""
+Optional build of the compiled MIN codec. All metadata lives in pyproject.toml.
+If Cython or a compiler is missing, pywisp falls back to the pure python codec.
+"""
+from setuptools import setup
+
+try:
+    from Cython.Build import cythonize
+    extModules = cythonize("pywisp/_cmin.pyx", quiet=True)
+    for ext in extModules:
+        ext.optional = True
+except ImportError:
+    extModules = []
+
+setup(ext_modules=extModules)
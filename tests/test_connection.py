@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+import os
+import random
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from pywisp.capture import HEADER, MAGIC, RECORD, readCapture
+from pywisp.connection import RecordSplitter, ReplayConnection, UdpConnection
+from pywisp.min import Packer, packFrame
+from pywisp.utils import coroutine, pipe
+
+
+@coroutine
+def ListReceiver(sink, size):
+    """ previous tcp receiver, kept as reference """
+    data = []
+    while True:
+        data.extend((yield))
+        while len(data) >= size:
+            f, data = data[:size], data[size:]
+            sink.send((f[0], bytes(f[1:])))
+
+
+def collect(frames):
+    @coroutine
+    def Collector():
+        while True:
+            id, payload = yield
+            frames.append((id, bytes(payload)))
+    return Collector
+
+
+@coroutine
+def Discard():
+    while True:
+        yield
+
+
+class RecordSplitterTestCase(unittest.TestCase):
+    # B&R style records: 1 byte id + 80 byte payload
+    size = 81
+
+    def setUp(self):
+        self.rng = random.Random(2468)
+
+    def chunked(self, stream, maxChunk):
+        chunks = []
+        pos = 0
+        while pos < len(stream):
+            n = self.rng.randrange(1, maxChunk)
+            chunks.append(stream[pos:pos + n])
+            pos += n
+        return chunks
+
+    def test_records(self):
+        stream = os.urandom(self.size * 500 + 17)
+        for maxChunk in [2, 100, 4096]:
+            want, got = [], []
+            ref = ListReceiver(collect(want)(), self.size)
+            rx = pipe([lambda sink: RecordSplitter(sink, self.size), collect(got)])
+            for c in self.chunked(stream, maxChunk):
+                ref.send(c)
+                rx.send(memoryview(c))
+            self.assertEqual(len(got), 500)
+            self.assertEqual(got, want)
+
+    def test_timings(self):
+        # one second of data at 10 kHz, read in chunks of 2048 bytes
+        stream = os.urandom(self.size * 10000)
+        chunks = [stream[i:i + 2048] for i in range(0, len(stream), 2048)]
+        for name, rx in [("list", ListReceiver), ("splitter", RecordSplitter)]:
+            recv = rx(Discard(), self.size)
+            t0 = time.perf_counter()
+            for c in chunks:
+                recv.send(c)
+            dt = time.perf_counter() - t0
+            print(f"\n{name} receiver needs {dt * 1e3:.2f} ms for 10000 records.")
+
+
+class BatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = UdpConnection('127.0.0.1', 0)
+        self.single, self.batches = [], []
+        self.conn.received.connect(self.single.append)
+        self.conn.receivedBatch.connect(self.batches.append)
+
+    def test_single(self):
+        emitter = self.conn.emitter()
+        emitter.send((3, memoryview(b'abc')))
+        self.assertEqual([(f.id, f.payload) for f in self.single], [(3, b'abc')])
+        self.assertEqual(self.batches, [])
+
+    def test_batch(self):
+        self.conn.batchSize = 3
+        self.conn.batchTime = 0.05
+        emitter = self.conn.emitter()
+        for id in range(4):
+            emitter.send((id, bytes([id])))
+        self.assertEqual(self.single, [])
+        self.assertEqual([[f.id for f in b] for b in self.batches], [[0, 1, 2]])
+        # remaining frame is only flushed once it is overdue
+        self.conn.flushDue()
+        self.assertEqual(len(self.batches), 1)
+        time.sleep(0.06)
+        self.conn.flushDue()
+        self.assertEqual([[f.id for f in b] for b in self.batches], [[0, 1, 2], [3]])
+
+    def test_idle(self):
+        rig = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        rig.bind(('127.0.0.1', 0))
+        self.conn.port = rig.getsockname()[1]
+        self.conn.batchSize = 10
+        self.conn.batchTime = 0.05
+        self.assertTrue(self.conn._connect())
+        reader = threading.Thread(target=self.conn.worker.run)
+        reader.start()
+        # fewer frames than batchSize, then the line stays idle
+        rig.sendto(b''.join(packFrame(id, bytes([id])) for id in range(5)),
+                   self.conn.sock.getsockname())
+        time.sleep(0.2)
+        self.conn.worker.quit()
+        reader.join()
+        self.conn._disconnect()
+        rig.close()
+        # the signal itself is queued to this thread, check the counter
+        self.assertEqual(self.conn._batch, [])
+        self.assertEqual(self.conn.emitted, 5)
+
+    def test_backlog(self):
+        emitter = self.conn.emitter()
+        for id in range(3):
+            emitter.send((id, b''))
+        self.assertEqual(self.conn.backlog, 3)
+        self.conn.handled += 2
+        self.assertEqual(self.conn.backlog, 1)
+
+
+class WriterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = UdpConnection('127.0.0.1', 0)
+        self.writes = []
+
+        @coroutine
+        def Sink():
+            while True:
+                self.writes.append((yield))
+
+        self.Sink = Sink
+        self.conn.tx = pipe([Sink])
+        self.writer = self.conn.writer
+
+    def frames(self, ids):
+        return [{'id': id, 'msg': bytes([id])} for id in ids]
+
+    def test_queue(self):
+        self.conn.connected = True
+        self.conn.writeData(self.frames([1])[0])
+        self.conn.writeData(self.frames([2, 3]))
+        self.conn.writeData(iter(self.frames([4, 5])))
+        self.writer.queue.put(None)
+        self.writer.run()
+        # lists in one write, other iterables frame by frame
+        self.assertEqual(self.writes, [(1, b'\x01'), [(2, b'\x02'), (3, b'\x03')],
+                                       (4, b'\x04'), (5, b'\x05')])
+
+    def test_lazy(self):
+        consumed = []
+
+        def gen():
+            for frame in self.frames(range(3)):
+                consumed.append(frame['id'])
+                yield frame
+
+        self.conn.connected = True
+        self.conn.writeData(gen())
+        self.assertEqual(consumed, [])
+        self.writer.queue.put(None)
+        self.writer.run()
+        self.assertEqual(consumed, [0, 1, 2])
+        self.assertEqual(len(self.writes), 3)
+
+    def test_disconnected(self):
+        self.conn.writeData(self.frames([1]))
+        self.assertTrue(self.writer.queue.empty())
+
+    def test_quit(self):
+        self.conn.connected = True
+        self.conn.writeData(self.frames([1]))
+        self.writer.quit()
+        self.writer.run()
+        self.assertEqual(self.writes, [[(1, b'\x01')]])
+
+    def test_discard(self):
+        self.conn.connected = True
+        self.conn.writeData(self.frames([1]))
+        self.writer.quit(discard=True)
+        self.writer.run()
+        self.assertEqual(self.writes, [])
+
+    def test_disconnect(self):
+        rig = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        rig.bind(('127.0.0.1', 0))
+        rig.settimeout(1)
+        conn = UdpConnection('127.0.0.1', rig.getsockname()[1])
+        self.assertTrue(conn.connect())
+        # like stopping the experiment right before disconnecting
+        conn.writeData({'id': 1, 'msg': bytes([0])})
+        conn.disconnect()
+        conn.thread.wait()
+        self.assertEqual(rig.recv(2048), packFrame(1, bytes([0])))
+        rig.close()
+
+    def test_rate(self):
+        self.conn.sendRate = 1000
+        self.conn.tx = pipe([Packer, self.conn._pace, self.Sink])
+        start = time.monotonic()
+        self.writer.write([{'id': id, 'msg': bytes(50)} for id in range(5)])
+        duration = time.monotonic() - start
+        self.assertEqual(len(self.writes), 5)
+        # the first frame passes at once, the others wait for their budget
+        self.assertGreater(duration, 0.18)
+        self.assertLess(duration, 0.5)
+
+
+class CaptureTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'test.pwcap')
+        self.conn = UdpConnection('127.0.0.1', 0)
+        self.received = []
+        self.conn.received.connect(self.received.append)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def feed(self, chunks):
+        # the reader thread reuses its receive buffer for every chunk
+        buf = bytearray(max(len(c) for c in chunks))
+        for chunk in chunks:
+            buf[:len(chunk)] = chunk
+            self.conn.worker.rx.send(memoryview(buf)[:len(chunk)])
+
+    def test_capture(self):
+        data = b''.join(packFrame(id, bytes([id])) for id in range(10, 20))
+        chunks = [data[i:i + 7] for i in range(0, len(data), 7)]
+        self.conn.startCapture(self.path)
+        self.feed(chunks)
+        self.conn.stopCapture()
+        records = list(readCapture(self.path))
+        self.assertEqual([d for _, d in records], chunks)
+        times = [t for t, _ in records]
+        self.assertEqual(times, sorted(times))
+        # the tap does not change what is received
+        self.assertEqual([f.id for f in self.received], list(range(10, 20)))
+
+    def test_stopped(self):
+        self.conn.startCapture(self.path)
+        self.feed([b'ab'])
+        self.conn.stopCapture()
+        self.feed([b'cd'])
+        self.assertEqual([d for _, d in readCapture(self.path)], [b'ab'])
+
+    def test_truncated(self):
+        self.conn.startCapture(self.path)
+        self.feed([b'abc', b'def'])
+        self.conn.stopCapture()
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 1)
+        self.assertEqual([d for _, d in readCapture(self.path)], [b'abc'])
+
+
+class ReplayTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'test.pwcap')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, records):
+        with open(self.path, 'wb') as f:
+            f.write(MAGIC + HEADER.pack(0))
+            for t, data in records:
+                f.write(RECORD.pack(t, len(data)) + data)
+
+    def replay(self, conn, duration=None):
+        # what the reader thread does
+        received = []
+        conn.received.connect(lambda frame: received.append((frame.id, frame.payload)))
+        self.assertTrue(conn._connect())
+        # start the experiment
+        conn.tx.send((1, bytes([1])))
+        buf = memoryview(bytearray(conn.recvSize))
+        start = time.monotonic()
+        while conn._pending is not None:
+            n = conn._recvInto(buf)
+            if n:
+                conn.worker.rx.send(buf[:n])
+        duration = time.monotonic() - start
+        conn._disconnect()
+        return received, duration
+
+    def test_min(self):
+        frames = [(id, bytes([id] * id)) for id in range(10, 30)]
+        data = b''.join(packFrame(*frame) for frame in frames)
+        self.write([(i * 1e-3, data[i:i + 5]) for i in range(0, len(data), 5)])
+        received, _ = self.replay(ReplayConnection(self.path, speed=0))
+        self.assertEqual(received, frames)
+
+    def test_tcp(self):
+        frames = [(id, bytes([id] * 80)) for id in range(10, 30)]
+        data = b''.join(bytes([id]) + payload for id, payload in frames)
+        self.write([(0, data[:100]), (0, data[100:])])
+        received, _ = self.replay(ReplayConnection(self.path, speed=0, maxPayload=80))
+        self.assertEqual(received, frames)
+
+    def test_speed(self):
+        self.write([(0, packFrame(10, b'a')), (0.2, packFrame(11, b'b'))])
+        received, duration = self.replay(ReplayConnection(self.path, speed=2))
+        self.assertEqual([id for id, _ in received], [10, 11])
+        self.assertGreater(duration, 0.09)
+        self.assertLess(duration, 0.3)
+        _, duration = self.replay(ReplayConnection(self.path, speed=0))
+        self.assertLess(duration, 0.05)
+
+    def test_start(self):
+        self.write([(1, packFrame(10, b'a')), (1.1, packFrame(11, b'b'))])
+        conn = ReplayConnection(self.path, speed=0)
+        self.assertTrue(conn._connect())
+        buf = memoryview(bytearray(conn.recvSize))
+        # held until the experiment starts, the heartbeat does not count
+        conn.tx.send((1, bytes([1 << 1])))
+        self.assertEqual(conn._recvInto(buf), 0)
+        conn.tx.send([(1, bytes([1]))])
+        n = conn._recvInto(buf)
+        self.assertEqual(bytes(buf[:n]), packFrame(10, b'a') + packFrame(11, b'b'))
+        conn._disconnect()
+
+    def test_restart(self):
+        self.write([(5, packFrame(10, b'a')), (5.1, packFrame(11, b'b'))])
+        conn = ReplayConnection(self.path, speed=1)
+        self.assertTrue(conn._connect())
+        buf = memoryview(bytearray(conn.recvSize))
+        # the recorded timing starts with the experiment, not the capture
+        conn.tx.send((1, bytes([1])))
+        self.assertEqual(bytes(buf[:conn._recvInto(buf)]), packFrame(10, b'a'))
+        conn.tx.send((1, bytes([0])))
+        self.assertEqual(conn._recvInto(buf), 0)
+        conn.tx.send((1, bytes([1])))
+        start = time.monotonic()
+        self.assertEqual(bytes(buf[:conn._recvInto(buf)]), packFrame(11, b'b'))
+        self.assertLess(time.monotonic() - start, 0.05)
+        conn._disconnect()
+
+    def test_missing(self):
+        conn = ReplayConnection(os.path.join(self.dir, 'missing.pwcap'))
+        self.assertFalse(conn._connect())
+
+
+if __name__ == '__main__':
+    unittest.main()
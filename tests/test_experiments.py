@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+import sys
+import threading
+import unittest
+from collections import OrderedDict
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QApplication
+
+from pywisp.experiments import ExperimentInteractor, ExperimentView
+from pywisp.experimentModules import ExperimentModule, ExperimentModuleException
+from pywisp.min import Frame
+from pywisp.registry import registerExperimentModule
+
+app = QApplication.instance() or QApplication(sys.argv)
+
+
+class CacheModule(ExperimentModule):
+    publicSettings = OrderedDict([("a", 1), ("b", 2)])
+    dataPoints = []
+    connection = 'A'
+
+
+registerExperimentModule(CacheModule)
+
+
+class StreamModule(ExperimentModule):
+    publicSettings = OrderedDict([("n", 3)])
+    dataPoints = []
+    connection = 'A'
+    consumed = []
+    failAt = None
+
+    def getStartParams(self, data):
+        return {'id': 10, 'msg': b''}
+
+    def getParams(self, data):
+        for i in range(data[0]):
+            if i == StreamModule.failAt:
+                raise ExperimentModuleException("broken parameter")
+            self.consumed.append(i)
+            yield {'id': 20, 'msg': bytes([i])}
+
+    def getStopParams(self, data):
+        pass
+
+
+registerExperimentModule(StreamModule)
+
+
+class DispatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        calls = self.calls
+
+        class Declared:
+            connection = 'A'
+            frameIds = [5, 6]
+
+            def handleFrame(self, frame):
+                calls.append(('Declared', frame.id))
+                return {'Time': 0, 'DataPoints': {'x': frame.id}}
+
+        class Undeclared:
+            connection = 'A'
+            frameIds = None
+
+            def handleFrame(self, frame):
+                calls.append(('Undeclared', frame.id))
+                if frame.id == 7:
+                    return {'Time': 0, 'DataPoints': {'y': frame.id}}
+
+        self.exp = ExperimentInteractor(None)
+        self.exp._buildFrameDispatch([Declared, Undeclared])
+
+    def test_declared(self):
+        data = self.exp.decodeFrame(Frame(5, b''), 'A')
+        self.assertEqual(data['DataPoints'], {'x': 5})
+        self.assertEqual(self.calls, [('Declared', 5)])
+
+    def test_fallback(self):
+        data = self.exp.decodeFrame(Frame(7, b''), 'A')
+        self.assertEqual(data['DataPoints'], {'y': 7})
+        self.assertIsNone(self.exp.decodeFrame(Frame(8, b''), 'A'))
+        self.assertEqual(self.calls, [('Undeclared', 7), ('Undeclared', 8)])
+
+    def test_other_connection(self):
+        self.assertIsNone(self.exp.decodeFrame(Frame(5, b''), 'B'))
+        self.assertEqual(self.calls, [])
+
+    def test_heartbeat(self):
+        frame = Frame(1, b'')
+        self.assertIs(self.exp.decodeFrame(frame, 'A'), frame)
+
+
+class SettingsCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.exp = ExperimentInteractor(ExperimentView())
+        self.exp.setExperiment({'Name': 'test', 'CacheModule': {'a': 3}})
+        self.reads = 0
+        getSettings = self.exp.getSettings
+
+        def countingGetSettings(item):
+            self.reads += 1
+            return getSettings(item)
+        self.exp.getSettings = countingGetSettings
+
+    def settings(self):
+        return [settings for _, _, settings in self.exp.activeModules()]
+
+    def test_cached(self):
+        self.assertEqual(self.settings(), [{'a': 3, 'b': 2}])
+        self.assertEqual(self.settings(), [{'a': 3, 'b': 2}])
+        self.assertEqual(self.reads, 1)
+
+    def test_edit(self):
+        self.settings()
+        self.exp.editExperiment({'CacheModule': {'b': 5}})
+        self.assertEqual(self.settings(), [{'a': 3, 'b': 5}])
+        self.assertEqual(self.reads, 2)
+
+    def test_view_edit(self):
+        self.settings()
+        model = self.exp.targetModel
+        index = model.index(0, 1, model.index(0, 0))
+        # what the delegate does when editing a value in the view
+        model.setData(index, "7", Qt.EditRole)
+        self.assertEqual(self.settings(), [{'a': 7, 'b': 2}])
+
+
+class StreamTestCase(unittest.TestCase):
+
+    def setUp(self):
+        StreamModule.consumed.clear()
+        StreamModule.failAt = None
+        self.exp = ExperimentInteractor(ExperimentView())
+        self.exp.setExperiment({'Name': 'test', 'StreamModule': {}})
+        self.sent = []
+        self.exp.sendData.connect(self.sent.append)
+
+    def test_stream(self):
+        self.exp.runExperiment()
+        self.assertEqual(StreamModule.consumed, [])
+        start, stream, end = self.sent
+        self.assertEqual([d['id'] for d in start], [10])
+        self.assertEqual(stream['connection'], 'A')
+        self.assertEqual([(d['id'], d['msg'], d['connection']) for d in stream['frames']],
+                         [(20, bytes([i]), 'A') for i in range(3)])
+        # the start command follows the streamed parameters
+        self.assertEqual(end, [{'id': 1, 'msg': bytes([1])}])
+
+    def test_failure(self):
+        StreamModule.failAt = 1
+        stops = []
+        self.exp.expStop.connect(lambda: stops.append(True))
+        self.exp.runExperiment()
+        # consumed by the writer thread of the connection
+        writer = threading.Thread(target=lambda: list(self.sent[1]['frames']))
+        writer.start()
+        writer.join()
+        self.assertEqual(StreamModule.consumed, [0])
+        app.processEvents()
+        self.assertEqual(stops, [True])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+import random
+import unittest
+from binascii import crc32
+from struct import pack as spack
+
+import pywisp.min as codec
+from pywisp.min import Packer, Decoder, Bytewise, HDRStuf, Unpacker, HDR, STF
+from pywisp.utils import coroutine, pipe
+
+
+def collect(frames):
+    @coroutine
+    def Collector():
+        while True:
+            frames.append((yield))
+    return Collector
+
+
+def bytewisePack(id, data):
+    """ reference implementation stuffing one byte at a time """
+    pld = bytes([id, len(data)]) + data
+    crc = crc32(pld)
+    ret = bytearray([HDR, HDR, HDR])
+    hdcnt = 0
+    for b in pld + spack('>I', crc):
+        ret.append(b)
+        if b == HDR:
+            hdcnt += 1
+            if hdcnt == 2:
+                ret.append(STF)
+                hdcnt = 0
+        else:
+            hdcnt = 0
+    ret.append(STF)
+    return bytes(ret)
+
+
+class PackerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = random.Random(4321)
+        self.wire = []
+        self.tx = pipe([Packer, collect(self.wire)])
+
+    def randomFrames(self, n):
+        return [(self.rng.randrange(64),
+                 bytes(self.rng.choice([HDR, HDR, HDR, STF, 0])
+                       for _ in range(self.rng.randrange(256))))
+                for _ in range(n)]
+
+    def test_single(self):
+        for id, data in self.randomFrames(200):
+            self.tx.send((id, data))
+            self.assertEqual(self.wire.pop(), bytewisePack(id, data))
+
+    def test_batch(self):
+        frames = self.randomFrames(200)
+        self.tx.send(frames)
+        self.assertEqual(len(self.wire), 1)
+        self.assertEqual(self.wire[0],
+                         b''.join(bytewisePack(*f) for f in frames))
+
+
+class DecoderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = random.Random(1234)
+        self.wire = []
+        self.tx = pipe([Packer, collect(self.wire)])
+
+    def randomFrame(self):
+        id = self.rng.randrange(64)
+        # favour HDR bytes to exercise the stuffing
+        data = bytes(self.rng.choice([HDR, HDR, STF, self.rng.randrange(256)])
+                     for _ in range(self.rng.randrange(256)))
+        return id, data
+
+    def decode(self, rx, chunks):
+        frames = []
+        dec = pipe([rx, collect(frames)])
+        for c in chunks:
+            dec.send(c)
+        return frames
+
+    def chunked(self, stream):
+        chunks = []
+        pos = 0
+        while pos < len(stream):
+            n = self.rng.randrange(1, 600)
+            chunks.append(stream[pos:pos + n])
+            pos += n
+        return chunks
+
+    def test_roundtrip(self):
+        sent = [self.randomFrame() for _ in range(200)]
+        for f in sent:
+            self.tx.send(f)
+        frames = self.decode(Decoder, self.chunked(b''.join(self.wire)))
+        self.assertEqual(frames, sent)
+
+    def test_single_bytes(self):
+        sent = [self.randomFrame() for _ in range(20)]
+        for f in sent:
+            self.tx.send(f)
+        stream = b''.join(self.wire)
+        frames = self.decode(Decoder, [stream[i:i + 1] for i in range(len(stream))])
+        self.assertEqual(frames, sent)
+
+    def test_split_after_header(self):
+        self.tx.send(self.randomFrame())
+        body = self.wire[0][3:]
+        # header at the very end of a chunk, followed by HDR HDR garbage
+        chunks = [b'\xaa\xaa\xaa', b'\xaa\xaa' + body]
+        want = self.decode([Bytewise, HDRStuf, Unpacker], chunks)
+        self.assertEqual(want, [])
+        self.assertEqual(self.decode(Decoder, chunks), want)
+        self.assertEqual(self.decode(codec.PyDecoder, chunks), want)
+
+    def test_same_as_pipeline(self):
+        for f in (self.randomFrame() for _ in range(300)):
+            self.tx.send(f)
+        stream = bytearray()
+        for w in self.wire:
+            # mix in garbage, truncated frames and flipped bits
+            choice = self.rng.randrange(6)
+            if choice == 0:
+                stream += bytes(self.rng.randrange(256) for _ in range(self.rng.randrange(10)))
+            elif choice == 1:
+                w = w[:self.rng.randrange(len(w))]
+            elif choice == 2:
+                w = bytearray(w)
+                w[self.rng.randrange(len(w))] ^= 1 << self.rng.randrange(8)
+            elif choice == 3:
+                stream += bytes([HDR] * self.rng.randrange(1, 4))
+            stream += w
+        stream = bytes(stream)
+        chunks = self.chunked(stream)
+        want = self.decode([Bytewise, HDRStuf, Unpacker], chunks)
+        got = self.decode(Decoder, chunks)
+        self.assertGreater(len(want), 100)
+        self.assertEqual(got, want)
+
+
+@unittest.skipIf(codec.codecBackend == 'python', "compiled codec not built")
+class BackendTestCase(unittest.TestCase):
+    """ check that the compiled codec matches the pure python one """
+
+    def setUp(self):
+        self.rng = random.Random(98765)
+
+    def randomFrames(self, n):
+        return [(self.rng.randrange(64),
+                 bytes(self.rng.choice([HDR, HDR, STF, self.rng.randrange(256)])
+                       for _ in range(self.rng.randrange(256))))
+                for _ in range(n)]
+
+    def decode(self, rx, chunks):
+        frames = []
+        dec = pipe([rx, collect(frames)])
+        for c in chunks:
+            dec.send(c)
+        return frames
+
+    def test_pack(self):
+        for id, data in self.randomFrames(500):
+            self.assertEqual(codec.packFrame(id, data), codec.pyPackFrame(id, data))
+            self.assertEqual(codec.packFrame(id, bytearray(data)), codec.pyPackFrame(id, data))
+        with self.assertRaises(AssertionError):
+            codec.packFrame(64, b'')
+        with self.assertRaises(AssertionError):
+            codec.packFrame(1, bytes(256))
+
+    def test_corrupted_stream(self):
+        for _ in range(20):
+            stream = bytearray()
+            for id, data in self.randomFrames(50):
+                w = bytearray(codec.pyPackFrame(id, data))
+                for _ in range(self.rng.randrange(3)):
+                    w[self.rng.randrange(len(w))] = self.rng.choice([HDR, STF, self.rng.randrange(256)])
+                if self.rng.random() < 0.2:
+                    w = w[:self.rng.randrange(len(w))]
+                stream += w
+                stream += bytes(self.rng.choice([HDR, STF, 0])
+                                for _ in range(self.rng.randrange(4)))
+            chunks = []
+            pos = 0
+            while pos < len(stream):
+                n = self.rng.randrange(1, 300)
+                chunks.append(bytes(stream[pos:pos + n]))
+                pos += n
+            want = self.decode(codec.PyDecoder, chunks)
+            self.assertEqual(self.decode(codec.Decoder, chunks), want)
+            self.assertEqual(want, self.decode([Bytewise, HDRStuf, Unpacker], chunks))
+
+
+if __name__ == '__main__':
+    unittest.main()
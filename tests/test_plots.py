@@ -12,7 +12,7 @@ import numpy as np
 import pyqtgraph as pg
 
 from PyQt5.QtWidgets import QApplication
-from pywisp.widgets.plotchart import PlotChart
+from pywisp.widgets.plotchart import DecimationPyramid, PlotChart
 from pywisp.utils import DataPointBuffer
 
 
@@ -63,6 +63,28 @@ class PlotTestCase(unittest.TestCase):
         self.app.processEvents()
         chart.close()
 
+    def test_skip_unchanged(self):
+        chart = PlotChart("test", {"MovingWindowEnable": False})
+        chart.show()
+        bufs = {'a': DataPointBuffer([0, 1], [0, 1]), 'b': DataPointBuffer([0, 1], [1, 0])}
+        for name, buf in bufs.items():
+            chart.addCurve(name, buf)
+        calls = []
+        for name, curve in chart.plotCurves.items():
+            curve.setData = lambda *args, name=name: calls.append(name)
+        chart.updateCurves(bufs)
+        self.assertEqual(calls, [])
+        bufs['b'].addValue(2, 2)
+        chart.updateCurves(bufs)
+        self.assertEqual(calls, ['b'])
+        # hidden charts are updated when shown again
+        chart.hide()
+        chart.pendingData = bufs
+        bufs['a'].addValue(2, 2)
+        chart.show()
+        self.assertEqual(calls, ['b', 'a'])
+        chart.close()
+
     def test_plot_incremental(self):
         print("entering incremental test")
         for mw, ds in product([False, True], ['peak', 'subsample', 'mean', 'off']):
@@ -90,8 +112,8 @@ class PlotTestCase(unittest.TestCase):
         times = []
         for i in range(20, npoints, 20):
             for key, buf in dps.items():
-                buf.time.extend(self.dataPoints[key].time[i-20: i])
-                buf.values.extend(self.dataPoints[key].values[i-20: i])
+                buf.extend(self.dataPoints[key].time[i-20: i],
+                           self.dataPoints[key].values[i-20: i])
             t0 = time.perf_counter()
             chart.updateCurves(dps)
             t1 = time.perf_counter()
@@ -156,5 +178,56 @@ class PlotTestCase(unittest.TestCase):
         self.app.exit()
 
 
+class DecimationPyramidTestCase(unittest.TestCase):
+
+    def reference(self, ds, x, y):
+        """ decimate the whole curve at once """
+        n = len(x) // ds
+        xs = x[ds // 2:n * ds:ds]
+        yb = y[:n * ds].reshape(n, ds)
+        peak = np.column_stack((yb.max(axis=1), yb.min(axis=1))).ravel()
+        return xs, peak, yb.mean(axis=1)
+
+    def test_incremental(self):
+        rng = np.random.default_rng(1357)
+        x = np.cumsum(rng.random(5000))
+        y = rng.standard_normal(5000)
+        pyramid = DecimationPyramid()
+        n = 0
+        while n < len(x):
+            n = min(len(x), n + int(rng.integers(1, 300)))
+            pyramid.update(x[:n], y[:n])
+        for ds in [2, 4, 8, 64, 1024]:
+            xs, peak, mean = self.reference(ds, x, y)
+            px, py = pyramid.sample(ds, 'peak', x, y)
+            np.testing.assert_array_equal(px, np.repeat(xs, 2))
+            np.testing.assert_array_equal(py, peak)
+            mx, my = pyramid.sample(ds, 'mean', x, y)
+            np.testing.assert_array_equal(mx, xs)
+            np.testing.assert_allclose(my, mean)
+
+    def test_levels(self):
+        x = np.arange(100.)
+        pyramid = DecimationPyramid()
+        # sample steps are rounded down to powers of two
+        self.assertEqual(len(pyramid.sample(5, 'mean', x, x)[0]), 25)
+        self.assertEqual(len(pyramid.sample(1, 'mean', x, x)[0]), 100)
+        self.assertEqual(len(pyramid.sample(4, 'off', x, x)[0]), 100)
+        self.assertEqual(len(pyramid.sample(4, 'subsample', x, x)[0]), 25)
+        # data not continuing the previous one rebuilds the levels
+        np.testing.assert_array_equal(pyramid.sample(2, 'mean', x[10:], -x[10:])[1][:2], [-10.5, -12.5])
+
+    def test_restart(self):
+        x = np.arange(100.)
+        buf = DataPointBuffer()
+        buf.extend(x[:50], x[:50])
+        pyramid = DecimationPyramid()
+        pyramid.sample(2, 'mean', buf.time, buf.values, buf.series)
+        # a new measurement with the same start time, already longer than the old one
+        buf.clearBuffer()
+        buf.extend(x, -x)
+        _, y = pyramid.sample(2, 'mean', buf.time, buf.values, buf.series)
+        np.testing.assert_array_equal(y, -(x[0::2] + 0.5))
+
 if __name__ == '__main__':
     unittest.main()
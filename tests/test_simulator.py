@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+import os
+import socket
+import struct
+import sys
+import time
+import unittest
+
+from PyQt5.QtCore import QCoreApplication
+
+from pywisp.connection import UdpConnection
+from pywisp.min import Decoder
+from pywisp.simulator import RigSimulator, SimSerialConnection, SimTcpConnection, SimUdpConnection
+from pywisp.utils import coroutine, pipe
+
+app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+
+
+def collect(frames):
+    @coroutine
+    def Collector():
+        while True:
+            frames.append((yield))
+    return Collector
+
+
+class SimulatorTestCase(unittest.TestCase):
+    channels = 3
+    rate = 2000
+
+    def run_rig(self, conn, duration=0.3):
+        frames = []
+        conn.received.connect(frames.append)
+        self.assertTrue(conn.connect())
+        try:
+            conn.writeData({'id': 10, 'msg': b'param'})
+            conn.writeData({'id': 1, 'msg': bytes([1])})
+            self.process(duration)
+            conn.writeData({'id': 1, 'msg': bytes([0])})
+            self.process(0.1)
+            count = len(frames)
+            self.process(0.1)
+            # nothing is sent after the stop command
+            self.assertEqual(len(frames), count)
+            # tcp records are padded
+            self.assertEqual([(id, payload[:5]) for id, payload in conn.simulator.received], [(10, b'param')])
+        finally:
+            conn.disconnect()
+        return frames
+
+    def process(self, duration):
+        t0 = time.monotonic()
+        while time.monotonic() - t0 < duration:
+            app.processEvents()
+            time.sleep(0.001)
+
+    def check(self, frames, duration=0.3):
+        self.assertGreater(len(frames), 0.5 * duration * self.rate)
+        self.assertLess(len(frames), 2 * duration * self.rate)
+        size = struct.calcsize(f'<L{self.channels}d')
+        times = [struct.unpack(f'<L{self.channels}d', f.payload[:size])[0] for f in frames]
+        self.assertEqual(times, sorted(times))
+        self.assertTrue(all(f.id == 15 for f in frames))
+
+    def test_udp(self):
+        conn = SimUdpConnection(channels=self.channels, rate=self.rate)
+        self.check(self.run_rig(conn))
+
+    def test_udp_batches(self):
+        rig = RigSimulator('udp', channels=4)
+        rig.start()
+        host = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        host.bind(('127.0.0.1', 0))
+        host.settimeout(0.1)
+        rig._host = host.getsockname()
+        frames = []
+        rx = pipe([Decoder, collect(frames)])
+        try:
+            # a batch of 100 frames exceeds the host's receive size
+            rig._write(rig._frames(0, 100))
+            while True:
+                rx.send(host.recv(UdpConnection.recvSize))
+        except socket.timeout:
+            pass
+        finally:
+            rig.stop()
+            host.close()
+        self.assertEqual(len(frames), 100)
+
+    def test_tcp(self):
+        conn = SimTcpConnection(channels=self.channels, rate=self.rate)
+        self.check(self.run_rig(conn))
+
+    @unittest.skipUnless(os.name == 'posix', "needs a pseudo terminal")
+    def test_serial(self):
+        conn = SimSerialConnection(channels=self.channels, rate=self.rate)
+        self.check(self.run_rig(conn))
+
+    def test_heartbeat(self):
+        conn = SimUdpConnection(channels=self.channels, rate=self.rate, heartbeatTimeout=0.1)
+        frames = []
+        conn.received.connect(frames.append)
+        self.assertTrue(conn.connect())
+        try:
+            conn.writeData({'id': 1, 'msg': bytes([1])})
+            for _ in range(3):
+                self.process(0.05)
+                conn.writeData({'id': 1, 'msg': bytes([1 << 1])})
+            self.assertTrue(conn.simulator.running)
+            self.process(0.3)
+            self.assertFalse(conn.simulator.running)
+            self.assertEqual(frames[-1].id, 1)
+        finally:
+            conn.disconnect()
+
+    def test_empty_command(self):
+        rig = RigSimulator('udp')
+        rig.start()
+        try:
+            rig._handler().send((1, b''))
+            self.assertFalse(rig.running)
+        finally:
+            rig.stop()
+
+    def test_channels(self):
+        with self.assertRaises(ValueError):
+            RigSimulator('tcp', channels=10)
+        RigSimulator('udp', channels=10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,15 +1,23 @@
 import os
 import pickle
 import random
+import shutil
 import string
+import struct
 import sys
+import tempfile
 import time
 import unittest
 
 import numpy as np
+import pandas as pd
+import pytest
 
+from PyQt5.QtTest import QSignalSpy
 from PyQt5.QtWidgets import QApplication
-from pywisp.utils import Exporter, DataPointBuffer
+from pywisp.gui import MainGui
+from pywisp.utils import Exporter, RefreshScheduler, getFormatedStructString, packArrayToFrame, iterArrayToFrames, \
+    DataPointBuffer, SampleTable, SpillFile, StoreThread, saveDataPoints, loadDataPoints, groupByTime, mergeChunks
 
 app = QApplication(sys.argv)
 class ExporterTestCase(unittest.TestCase):
@@ -17,6 +25,9 @@ class ExporterTestCase(unittest.TestCase):
     d_name = os.path.join(base_path, "dataPoints.pkl")
     csv_name = os.path.join(base_path, "test.csv")
     png_name = os.path.join(base_path, "test.png")
+    npz_name = os.path.join(base_path, "test.npz")
+    parquet_name = os.path.join(base_path, "test.parquet")
+    feather_name = os.path.join(base_path, "test.feather")
 
     def setUp(self):
         if os.path.exists(self.d_name):
@@ -54,7 +65,9 @@ class ExporterTestCase(unittest.TestCase):
         self.assertTrue(os.path.exists(self.csv_name))
 
     def test_export_png(self):
-        e = Exporter(dataPoints=self.dataPoints, fileName=self.png_name)
+        # drawing is the bulk of the time, a few curves cover the export
+        dataPoints = dict(list(self.dataPoints.items())[:5])
+        e = Exporter(dataPoints=dataPoints, fileName=self.png_name)
         # this will spawn a new thread
         e.runExport()
         # wait until that is finished
@@ -62,14 +75,31 @@ class ExporterTestCase(unittest.TestCase):
         del e
         self.assertTrue(os.path.exists(self.png_name))
 
+    def test_export_png_long(self):
+        buf = DataPointBuffer()
+        t = np.arange(10 ** 6) / 1000
+        buf.extend(t, np.sin(t) + np.random.rand(len(t)))
+        e = Exporter(dataPoints={'long': buf}, fileName=self.png_name)
+        t0 = time.perf_counter()
+        e.runExport()
+        e.wait()
+        dt = time.perf_counter() - t0
+        print(f"Time needed for png export of {len(t)} samples is {dt} seconds.")
+        self.assertTrue(os.path.exists(self.png_name))
+
     def test_export_png_no_abort(self):
-        e = Exporter(dataPoints=self.dataPoints, fileName=self.png_name)
+        # enough curves to keep the export running while the exporter is deleted
+        dataPoints = dict(list(self.dataPoints.items())[:10])
+        e = Exporter(dataPoints=dataPoints, fileName=self.png_name)
         # this will spawn a new thread
         e.runExport()
+        worker = e.worker
         # do not wait (simulates closing the gui while exporting)
         del e
         # file should not be there as thread was killed
         self.assertFalse(os.path.exists(self.png_name))
+        # let the thread finish before the next test
+        worker.wait()
 
     def test_timings(self):
         e = Exporter(dataPoints=self.dataPoints, fileName=self.csv_name)
@@ -77,15 +107,434 @@ class ExporterTestCase(unittest.TestCase):
         t0 = time.perf_counter()
         N = 10
         for n in range(N):
-            e.worker._buildFrame()
+            for chunk in mergeChunks(self.dataPoints, groupByTime(self.dataPoints)):
+                pass
+        dt = time.perf_counter() - t0
+        print(f"Average time needed for merging the chunks is {dt/N} seconds.")
+
+        t0 = time.perf_counter()
+        e.runExport()
+        e.wait()
         dt = time.perf_counter() - t0
-        print(f"Average time needed for init is {dt/N} seconds.")
+        print(f"Time needed for csv export is {dt} seconds.")
+
+    def mixed(self):
+        # two data points sharing a time axis and one with its own
+        a, b, c = DataPointBuffer(), DataPointBuffer(), DataPointBuffer()
+        for t in range(100):
+            a.addValue(t, 1.5 * t)
+            b.addValue(t, -t)
+            if t % 3 == 0:
+                c.addValue(t + 0.5, t)
+        return {'a': a, 'c': c, 'b': b}
+
+    def test_csv_chunks(self):
+        dataPoints = self.mixed()
+        # reference: the dense union frame the exporter used to build
+        df = pd.DataFrame({k: pd.Series(v.values, index=v.time) for k, v in dataPoints.items()})
+        df.index.name = 'time'
+        for processes in [1, 2]:
+            e = Exporter(dataPoints=dataPoints, fileName=self.csv_name, chunkSize=7, processes=processes)
+            e.runExport()
+            e.wait()
+            with open(self.csv_name) as f:
+                self.assertEqual(f.read(), df.sort_index().to_csv())
+
+    def test_merge(self):
+        dataPoints = self.mixed()
+        groups = groupByTime(dataPoints)
+        self.assertEqual([names for _, names in groups], [['a', 'b'], ['c']])
+        chunks = list(mergeChunks(dataPoints, groups, 10))
+        self.assertTrue(all(len(t) <= 20 for t, _ in chunks))
+        time = np.concatenate([t for t, _ in chunks])
+        block = np.concatenate([b for _, b in chunks])
+        np.testing.assert_array_equal(time, np.union1d(dataPoints['a'].time, dataPoints['c'].time))
+        np.testing.assert_array_equal(block[np.isin(time, dataPoints['c'].time), 1], dataPoints['c'].values)
+
+    def test_export_npz(self):
+        dataPoints = self.mixed()
+        e = Exporter(dataPoints=dataPoints, fileName=self.npz_name)
+        e.runExport()
+        e.wait()
+        with np.load(self.npz_name) as data:
+            for name, buf in dataPoints.items():
+                np.testing.assert_array_equal(data[name], buf.values)
+                np.testing.assert_array_equal(data[name + '_time'], buf.time)
+
+    def checkTable(self, dataPoints, table):
+        self.assertEqual(table.column_names, ['time'] + list(dataPoints))
+        df = table.to_pandas()
+        # one row per sample of each time group, the other groups are null
+        self.assertEqual(len(df), sum(len(t) for t, _ in groupByTime(dataPoints)))
+        for name, buf in dataPoints.items():
+            rows = df[name].notna()
+            np.testing.assert_array_equal(df['time'][rows], buf.time)
+            np.testing.assert_array_equal(df[name][rows], buf.values)
+
+    def test_export_parquet(self):
+        pq = pytest.importorskip('pyarrow.parquet')
+        dataPoints = self.mixed()
+        e = Exporter(dataPoints=dataPoints, fileName=self.parquet_name)
+        e.runExport()
+        e.wait()
+        self.checkTable(dataPoints, pq.read_table(self.parquet_name))
+
+    def test_export_feather(self):
+        feather = pytest.importorskip('pyarrow.feather')
+        dataPoints = self.mixed()
+        e = Exporter(dataPoints=dataPoints, fileName=self.feather_name)
+        e.runExport()
+        e.wait()
+        self.checkTable(dataPoints, feather.read_table(self.feather_name))
 
     def tearDown(self):
-        for f_name in [self.csv_name, self.png_name]:
+        for f_name in [self.csv_name, self.png_name, self.npz_name, self.parquet_name, self.feather_name]:
             if os.path.exists(f_name):
                 os.remove(f_name)
 
 
+class DataPointBufferTestCase(unittest.TestCase):
+
+    def test_add_value(self):
+        buf = DataPointBuffer(capacity=4)
+        for t in range(10):
+            buf.addValue(t / 10, 2 * t)
+        self.assertEqual(len(buf), 10)
+        np.testing.assert_array_equal(buf.time, np.arange(10) / 10)
+        np.testing.assert_array_equal(buf.values, 2 * np.arange(10))
+
+    def test_no_values(self):
+        buf = DataPointBuffer(time=[0, 1, 2])
+        np.testing.assert_array_equal(buf.time, [0, 1, 2])
+        self.assertTrue(np.isnan(buf.values).all())
+        self.assertEqual(len(DataPointBuffer(time=[0, 1], dtype=np.int32).values), 2)
+
+    def test_views(self):
+        buf = DataPointBuffer(time=[0, 1], values=[2, 3])
+        values = buf.values
+        buf.addValue(2, 4)
+        # views are not copied and keep their length
+        self.assertTrue(np.shares_memory(values, buf.values))
+        np.testing.assert_array_equal(values, [2, 3])
+
+    def test_clear(self):
+        buf = DataPointBuffer(time=[0, 1], values=[2, 3])
+        buf.clearBuffer()
+        self.assertEqual(len(buf), 0)
+        self.assertEqual(len(buf.time), 0)
+        buf.addValue(5, 6)
+        np.testing.assert_array_equal(buf.values, [6])
+
+    def test_dtype(self):
+        buf = DataPointBuffer(dtype=np.int32)
+        buf.extend([0, 1, 2], [1, 2, 3])
+        self.assertEqual(buf.values.dtype, np.int32)
+
+    def test_pickle(self):
+        buf = DataPointBuffer(time=[0, 1], values=[2, 3])
+        data = pickle.loads(pickle.dumps(buf))
+        np.testing.assert_array_equal(data.time, buf.time)
+        np.testing.assert_array_equal(data.values, buf.values)
+        # buffers pickled with list members are still readable
+        old = DataPointBuffer.__new__(DataPointBuffer)
+        old.__setstate__({'time': [0.0, 1.0], 'values': [2.0, 3.0]})
+        np.testing.assert_array_equal(old.values, [2, 3])
+
+    def test_generation(self):
+        buf = DataPointBuffer()
+        gens = [buf.generation]
+        buf.addValue(0, 1)
+        gens.append(buf.generation)
+        buf.extend([1], [2])
+        gens.append(buf.generation)
+        buf.clearBuffer()
+        gens.append(buf.generation)
+        self.assertEqual(len(set(gens)), 4)
+        # unchanged buffers keep their generation
+        self.assertEqual(buf.generation, gens[-1])
+
+    def test_series(self):
+        buf = DataPointBuffer(capacity=4, maxSize=2)
+        series = buf.series
+        buf.extend([0, 1, 2, 3], [0, 1, 2, 3])
+        self.assertEqual(buf.series, series)
+        # samples dropped by the retention limit
+        buf.addValue(4, 4)
+        self.assertNotEqual(buf.series, series)
+        series = buf.series
+        buf.clearBuffer()
+        self.assertNotEqual(buf.series, series)
+
+    def test_retention_size(self):
+        buf = DataPointBuffer(capacity=4, maxSize=10)
+        for t in range(1000):
+            buf.addValue(t, t)
+            self.assertGreaterEqual(len(buf), min(t + 1, 10))
+            self.assertEqual(buf.values[-1], t)
+        self.assertLessEqual(len(buf._time), 40)
+        np.testing.assert_array_equal(buf.values[-10:], range(990, 1000))
+
+    def test_retention_time(self):
+        buf = DataPointBuffer(capacity=4, maxTime=1)
+        for t in range(1000):
+            buf.addValue(t / 100, t)
+        self.assertLessEqual(len(buf._time), 4 * 101)
+        self.assertLessEqual(buf.time[0], 9.99 - 1)
+        np.testing.assert_array_equal(np.diff(buf.values), 1)
+
+    def test_spill(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        buf = DataPointBuffer(capacity=4, maxSize=10, spill=SpillFile(os.path.join(path, 'a.bin')))
+        for t in range(1000):
+            buf.addValue(t, -t)
+        time, values = buf.spill.read()
+        np.testing.assert_array_equal(np.concatenate([time, buf.time]), range(1000))
+        np.testing.assert_array_equal(np.concatenate([values, buf.values]), -np.arange(1000))
+        buf.clearBuffer()
+        self.assertEqual(len(buf.spill), 0)
+
+
+class SampleTableTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.table = SampleTable(['a', 'b'], capacity=2)
+        self.a, self.b = DataPointBuffer(), DataPointBuffer()
+        self.a.bind(self.table, 'a')
+        self.b.bind(self.table, 'b')
+        for t in range(5):
+            self.table.addRow(t, (t, -t))
+
+    def test_views(self):
+        self.assertEqual(len(self.a), 5)
+        np.testing.assert_array_equal(self.a.time, range(5))
+        np.testing.assert_array_equal(self.b.time, range(5))
+        np.testing.assert_array_equal(self.a.values, [0, 1, 2, 3, 4])
+        np.testing.assert_array_equal(self.b.values, [0, -1, -2, -3, -4])
+        self.assertTrue(np.shares_memory(self.a.time, self.b.time))
+
+    def test_unbind(self):
+        # adding single values detaches the buffer from the table
+        self.a.addValue(5, 5)
+        self.assertIsNone(self.a.table)
+        np.testing.assert_array_equal(self.a.values, range(6))
+        self.assertEqual(len(self.b), 5)
+
+    def test_copy(self):
+        data = pickle.loads(pickle.dumps(self.b))
+        self.assertIsNone(data.table)
+        np.testing.assert_array_equal(data.values, self.b.values)
+
+    def test_generation(self):
+        gen = self.a.generation
+        self.assertEqual(self.b.generation, gen)
+        self.table.addRow(5, (5, -5))
+        self.assertNotEqual(self.a.generation, gen)
+        self.assertEqual(self.a.generation, self.b.generation)
+
+    def test_retention(self):
+        self.table.maxSize = 3
+        for t in range(5, 100):
+            self.table.addRow(t, (t, -t))
+        self.assertLessEqual(len(self.table._data), 16)
+        np.testing.assert_array_equal(self.a.time[-3:], [97, 98, 99])
+        np.testing.assert_array_equal(self.b.values[-3:], [-97, -98, -99])
+
+    def test_spill(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        spills = {name: SpillFile(os.path.join(path, name)) for name in 'ab'}
+        table = SampleTable(['a', 'b'], capacity=2, maxSize=3, spills=spills)
+        a, b = DataPointBuffer(spill=spills['a']), DataPointBuffer(spill=spills['b'])
+        a.bind(table, 'a')
+        b.bind(table, 'b')
+        for t in range(50):
+            table.addRow(t, (t, -t))
+        # the unbound buffer keeps spilling to the same file
+        for t in range(50, 100):
+            a.addValue(t, t)
+        for buf, sign, n in ((a, 1, 100), (b, -1, 50)):
+            time, values = buf.spill.read()
+            np.testing.assert_array_equal(np.concatenate([time, buf.time]), range(n))
+            np.testing.assert_array_equal(np.concatenate([values, buf.values]), sign * np.arange(n))
+
+
+class StoreDataTestCase(unittest.TestCase):
+    """ storing of frame data points by the gui, see MainGui._storeData """
+
+    class Gui(object):
+        _storeData = MainGui._storeData
+        _createSampleTable = MainGui._createSampleTable
+        _retention = MainGui._retention
+
+        def __init__(self, names):
+            self.config = {'RetentionTime': 0, 'RetentionSize': 0}
+            self._currentSampleTables = {}
+            self._currentDataPointBuffers = {name: DataPointBuffer() for name in names}
+
+    def test_subset(self):
+        gui = self.Gui(['x', 'y'])
+        gui._storeData(0, {'x': 1, 'y': 2})
+        # x leaves the table, later full frames must still reach it
+        gui._storeData(1, {'x': 3})
+        gui._storeData(2, {'x': 5, 'y': 6})
+        x, y = gui._currentDataPointBuffers['x'], gui._currentDataPointBuffers['y']
+        np.testing.assert_array_equal(x.time, [0, 1, 2])
+        np.testing.assert_array_equal(x.values, [1, 3, 5])
+        np.testing.assert_array_equal(y.time, [0, 2])
+        np.testing.assert_array_equal(y.values, [2, 6])
+
+
+class StoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        table = SampleTable(['a', 'b'])
+        self.dataPoints = {'a': DataPointBuffer(), 'b': DataPointBuffer(),
+                           'c: empty': DataPointBuffer(),
+                           'd': DataPointBuffer(time=[0.5, 1.5], values=[1, 2])}
+        self.dataPoints['a'].bind(table, 'a')
+        self.dataPoints['b'].bind(table, 'b')
+        for t in range(5):
+            table.addRow(t, (t, -t))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_roundtrip(self):
+        saveDataPoints(self.dataPoints, self.path)
+        # a and b share their time file
+        self.assertEqual(len([f for f in os.listdir(self.path) if f.startswith('time')]), 3)
+        data = loadDataPoints(self.path)
+        self.assertEqual(list(data), list(self.dataPoints))
+        for name, buf in self.dataPoints.items():
+            np.testing.assert_array_equal(data[name].time, buf.time)
+            np.testing.assert_array_equal(data[name].values, buf.values)
+        self.assertIsInstance(data['a'].values, np.memmap)
+
+    def test_spill(self):
+        spill = SpillFile(os.path.join(self.path, 'e.bin'))
+        self.dataPoints['e'] = DataPointBuffer(capacity=4, maxSize=2, spill=spill)
+        self.dataPoints['e'].extend(range(10), range(10))
+        spill.close()
+        path = os.path.join(self.path, 'stored')
+        saveDataPoints(self.dataPoints, path)
+        data = loadDataPoints(path)
+        np.testing.assert_array_equal(data['e'].time, range(10))
+        np.testing.assert_array_equal(data['e'].values, range(10))
+
+    def test_no_write_back(self):
+        saveDataPoints(self.dataPoints, self.path)
+        data = loadDataPoints(self.path)
+        data['d'].clearBuffer()
+        data['d'].addValue(3, 3)
+        np.testing.assert_array_equal(loadDataPoints(self.path)['d'].values, [1, 2])
+
+    def test_thread(self):
+        thread = StoreThread(self.dataPoints, self.path)
+        stored = QSignalSpy(thread.stored)
+        thread.start()
+        self.assertTrue(thread.wait(5000))
+        self.assertEqual(len(stored), 1)
+        np.testing.assert_array_equal(stored[0][0]['b'].values, self.dataPoints['b'].values)
+        self.assertEqual(os.listdir(self.path), [os.path.basename(thread.path)])
+
+    def test_thread_failed(self):
+        class Buffer(object):
+            table = None
+            spill = None
+
+            @property
+            def time(self):
+                raise OSError("disk full")
+
+        thread = StoreThread({'a': Buffer()}, self.path)
+        failed = QSignalSpy(thread.failed)
+        thread.start()
+        self.assertTrue(thread.wait(5000))
+        self.assertEqual(len(failed), 1)
+        self.assertIsNone(thread.path)
+        self.assertEqual(os.listdir(self.path), [])
+
+
+def legacyPackArrayToFrame(id, data, frameLen, dataLenFloat, dataLenInt):
+    """ previous element wise implementation of packArrayToFrame, kept as reference """
+    completeData = len(data) * dataLenFloat + 1 * dataLenInt
+    N = np.ceil(completeData / frameLen)
+    frameLenFloat = frameLen // dataLenFloat
+    dataPoints = []
+    for i in range(int(N)):
+        if i > 0:
+            outList = [float(data[i * frameLenFloat + j - 1]) for j in range(frameLenFloat) if
+                       i * frameLenFloat + j - 1 < len(data)]
+            fmtStr = getFormatedStructString(dataLenFloat, 0, len(outList))
+            payload = struct.pack(fmtStr, *outList)
+        else:
+            outList = [len(data)]
+            outList += [float(data[i * frameLenFloat + j]) for j in range(frameLenFloat - 1) if
+                        i * frameLenFloat + j < len(data)]
+            fmtStr = getFormatedStructString(dataLenFloat, dataLenInt, len(outList) - 1)
+            payload = struct.pack(fmtStr, *outList)
+        dataPoints += [{'id': id,
+                        'msg': payload}]
+    return dataPoints
+
+
+class PackArrayTestCase(unittest.TestCase):
+
+    def test_identical(self):
+        rng = np.random.default_rng(8642)
+        for n in [0, 1, 2, 9, 10, 11, 100, 1001]:
+            data = rng.standard_normal(n) * 1e3
+            for frameLen in [8, 30, 64, 80, 255]:
+                for dataLenFloat in [4, 8]:
+                    for dataLenInt in [1, 2, 4]:
+                        args = (21, data, frameLen, dataLenFloat, dataLenInt)
+                        if n >= 256 ** dataLenInt:
+                            # length does not fit into the header
+                            self.assertRaises(struct.error, legacyPackArrayToFrame, *args)
+                            self.assertRaises(struct.error, packArrayToFrame, *args)
+                            continue
+                        self.assertEqual(packArrayToFrame(*args), legacyPackArrayToFrame(*args), args)
+
+    def test_list(self):
+        data = [1, 2.5, -3, 4e10]
+        self.assertEqual(packArrayToFrame(3, data, 16, 8, 2), legacyPackArrayToFrame(3, data, 16, 8, 2))
+
+    def test_lazy(self):
+        frames = iterArrayToFrames(21, np.arange(1000.), 80, 8, 4)
+        self.assertEqual(next(frames), {'id': 21, 'msg': struct.pack('<I9d', 1000, *range(9))})
+
+    def test_timings(self):
+        data = np.random.standard_normal(50000)
+        for name, pack in [("legacy", legacyPackArrayToFrame), ("vectorized", packArrayToFrame)]:
+            t0 = time.perf_counter()
+            pack(21, data, 80, 8, 4)
+            dt = time.perf_counter() - t0
+            print(f"\n{name} packing of 50000 values takes {dt * 1e3:.2f} ms.")
+
+
+class RefreshSchedulerTestCase(unittest.TestCase):
+
+    def test_draw_time(self):
+        sched = RefreshScheduler(20, 500, load=0.25)
+        self.assertEqual(sched.update(1), 20)
+        # slow drawing increases the interval at once
+        self.assertEqual(sched.update(50), 200)
+        self.assertEqual(sched.update(1000), 500)
+        # and it recovers gradually
+        intervals = [sched.update(1) for _ in range(30)]
+        self.assertEqual(intervals, sorted(intervals, reverse=True))
+        self.assertEqual(intervals[-1], 20)
+
+    def test_backlog(self):
+        sched = RefreshScheduler(20, 500)
+        self.assertEqual(sched.update(1, 50), 20)
+        self.assertEqual(sched.update(1, 200), 40)
+        self.assertEqual(sched.update(1, 400), 80)
+        # a backlog, that stops growing, lets the interval decrease
+        self.assertLess(sched.update(1, 400), 80)
+
+
 if __name__ == '__main__':
     unittest.main()